@@ -0,0 +1,125 @@
+# Mesure de la mémoire (RSS) du client Discord selon la taille des serveurs, pour
+# comparer les profils CLIENT_PROFILE=full et CLIENT_PROFILE=lean de relay_bot.py.
+# Chaque mesure tourne dans un processus neuf : le client reçoit des GUILD_CREATE et
+# des MESSAGE_CREATE synthétiques, comme s'ils venaient du gateway.
+#   python bench_memoire.py                  # tableau complet
+#   python bench_memoire.py 1000 50000       # tailles de serveur choisies
+import gc
+import os
+import subprocess
+import sys
+
+PROFILES = ("full", "lean")
+DEFAULT_SIZES = (1000, 10000, 50000)
+GUILDS = int(os.getenv("BENCH_GUILDS", "3"))
+MESSAGES = int(os.getenv("BENCH_MESSAGES", "5000"))
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def user_payload(user_id):
+    return {"id": str(user_id), "username": f"membre{user_id}", "discriminator": "0001", "avatar": None}
+
+def member_payload(user_id):
+    return {"user": user_payload(user_id), "roles": [], "joined_at": "2022-01-01T00:00:00+00:00", "deaf": False, "mute": False}
+
+# Serveur de `size` membres : une part d'entre eux est envoyée dans le GUILD_CREATE
+# (membres en vocal, comme le fait Discord sans l'intent members), salons, rôles et emojis
+# grandissent avec la taille
+def guild_payload(guild_id, size):
+    base = guild_id * 10**7
+    channels = [
+        {"id": str(base + i), "type": 0, "name": f"salon-{i}", "position": i, "permission_overwrites": []}
+        for i in range(20 + size // 1000)
+    ]
+    roles = [
+        {"id": str(base + 100000 + i), "name": f"role-{i}", "permissions": "0", "position": i,
+         "color": 0, "hoist": False, "managed": False, "mentionable": False}
+        for i in range(10 + size // 500)
+    ]
+    emojis = [
+        {"id": str(base + 200000 + i), "name": f"emoji{i}", "animated": False, "available": True}
+        for i in range(min(250, 10 + size // 200))
+    ]
+    in_voice = [base + 300000 + i for i in range(size // 20)]
+    return {
+        "id": str(guild_id),
+        "name": f"serveur-{guild_id}",
+        "member_count": size,
+        "large": size > 250,
+        "channels": channels,
+        "roles": roles,
+        "emojis": emojis,
+        "members": [member_payload(user_id) for user_id in in_voice],
+        "voice_states": [
+            {"user_id": str(user_id), "channel_id": channels[0]["id"], "session_id": "x",
+             "deaf": False, "mute": False, "self_deaf": False, "self_mute": False, "suppress": False}
+            for user_id in in_voice
+        ],
+        "threads": [],
+        "stickers": [],
+    }
+
+def message_payload(message_id, guild, size):
+    author_id = guild * 10**7 + 400000 + message_id % size
+    return {
+        "id": str(message_id),
+        "channel_id": str(guild * 10**7),
+        "guild_id": str(guild),
+        "author": user_payload(author_id),
+        "member": {"roles": [], "joined_at": "2022-01-01T00:00:00+00:00", "deaf": False, "mute": False},
+        "content": f"message numéro {message_id} pour le relais des traductions",
+        "timestamp": "2022-01-01T00:00:00+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+
+def measure(profile, size):
+    os.environ["CLIENT_PROFILE"] = profile
+    os.environ["RELAY_JOURNAL"] = ""
+    os.environ["CONFIG_RELOAD_INTERVAL"] = "0"
+    import relay_bot
+    state = relay_bot.client._connection
+    # On mesure les caches, pas les gestionnaires d'événements
+    state.dispatch = lambda *args, **kwargs: None
+    gc.collect()
+    before = rss_mb()
+    for guild_id in range(1, GUILDS + 1):
+        state._add_guild_from_data(guild_payload(guild_id, size))
+    for message_id in range(MESSAGES):
+        state.parse_message_create(message_payload(10**12 + message_id, 1 + message_id % GUILDS, size))
+    gc.collect()
+    cached_members = sum(len(guild.members) for guild in state.guilds)
+    cached_messages = len(state._messages) if state._messages is not None else 0
+    print(f"{rss_mb() - before:.1f} {cached_members} {cached_messages}")
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--run":
+        measure(sys.argv[2], int(sys.argv[3]))
+        return
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print(f"{GUILDS} serveur(s), {MESSAGES} messages reçus")
+    print(f"{'membres':>10} {'profil':>6} {'RSS (Mo)':>9} {'membres en cache':>17} {'messages en cache':>18}")
+    for size in sizes:
+        for profile in PROFILES:
+            result = subprocess.run(
+                [sys.executable, __file__, "--run", profile, str(size)],
+                capture_output=True, text=True, check=True,
+            )
+            rss, members, messages = result.stdout.split()[-3:]
+            print(f"{size:>10} {profile:>6} {float(rss):>9.1f} {members:>17} {messages:>18}")
+
+if __name__ == "__main__":
+    main()
@@ -5,15 +5,17 @@ from dotenv import load_dotenv
 from flask import Flask
 import threading
 import logging
+from relay_logging import loggable, setup_logging
 import asyncio
 
-# Configurer les logs
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
 # Charger les variables d'environnement
 load_dotenv()
 
+# Configurer les logs (écriture hors de la boucle d'événements, échantillonnage
+# des événements fréquents : voir relay_logging.py)
+setup_logging()
+logger = logging.getLogger(__name__)
+
 # Configuration du bot Discord
 intents = discord.Intents.default()
 intents.message_content = True
@@ -53,7 +55,10 @@ async def on_message(message):
     if message.author == client.user:  # Ignorer les messages du bot lui-même
         return
 
-    logger.info(f"Message reçu dans {message.channel.name} par {message.author.name}: {message.content}")
+    logger.info(
+        "Message reçu dans %s par %s: %s", message.channel.name, message.author.name, loggable(message.content),
+        extra={"event": "message_received"},
+    )
 
     # Gestion des salons existants avec redirection
     if message.channel.name in channels:
@@ -148,7 +153,7 @@ def run_bot():
     while True:
         try:
             logger.info("Démarrage du bot Discord...")
-            client.run(os.getenv("DISCORD_TOKEN"))
+            client.run(os.getenv("DISCORD_TOKEN"), log_handler=None)
         except Exception as e:
             logger.error(f"Le bot s'est arrêté avec une erreur : {e}")
             logger.info("Tentative de reconnexion dans 5 secondes...")
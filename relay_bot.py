@@ -0,0 +1,2663 @@
+# Le bot de relais et de traduction. Le point d'entrée est main.py ; ce module
+# s'importe sans rien démarrer (le bot ne se connecte qu'avec run_bot()).
+from relay_web import app, mark_startup, startup_timings
+import relay_logging
+from relay_logging import loggable
+import discord
+import aiohttp
+import multiprocessing
+import relay_tracing
+import translation_worker
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import re
+import signal
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from flask import jsonify, request
+
+mark_startup("imports")
+logger = logging.getLogger(__name__)
+
+# Ordonnanceur des envois vers Discord : toutes les requêtes sortantes (copies,
+# réponses, suppressions) passent par une file à priorités, et chaque route a son
+# seau de jetons, recalé sur les en-têtes X-RateLimit-* des réponses de Discord.
+PRIORITY_RELAY = 0    # Copies dans les salons de relais
+PRIORITY_REPLY = 1    # Réponses aux réactions, réactions, messages d'erreur
+PRIORITY_CLEANUP = 2  # Suppressions différées
+LANE_NAMES = {PRIORITY_RELAY: "relay", PRIORITY_REPLY: "reply", PRIORITY_CLEANUP: "cleanup"}
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "8"))
+# Workers réservés aux copies : réponses et suppressions n'occupent jamais plus que le reste
+SEND_RELAY_RESERVED = int(os.getenv("SEND_RELAY_RESERVED", "2"))
+
+# Limites supposées tant que Discord n'a pas renvoyé d'en-têtes pour la route : (requêtes, secondes)
+DEFAULT_ROUTE_LIMITS = {"react": (1, 0.25), "delete": (5, 1)}
+DEFAULT_ROUTE_LIMIT = (5, 5)
+
+# Correspondance URL de l'API -> route de l'ordonnanceur (type d'opération, identifiant majeur)
+ROUTE_PATTERNS = [
+    ("POST", re.compile(r"/channels/(\d+)/messages$"), "send"),
+    ("PATCH", re.compile(r"/channels/(\d+)/messages/\d+$"), "edit"),
+    ("DELETE", re.compile(r"/channels/(\d+)/messages/\d+$"), "delete"),
+    ("POST", re.compile(r"/channels/(\d+)/messages/bulk-delete$"), "delete"),
+    ("PUT", re.compile(r"/channels/(\d+)/messages/\d+/reactions/"), "react"),
+    (None, re.compile(r"/webhooks/(\d+)/"), "webhook"),
+]
+
+class RouteBucket:
+    __slots__ = ("capacity", "period", "tokens", "updated", "blocked_until")
+
+    def __init__(self, capacity, period, now):
+        self.capacity = capacity
+        self.period = period
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / self.period)
+        self.updated = now
+
+    # Délai avant de pouvoir envoyer sur cette route (0 si un jeton est disponible)
+    def wait_time(self, now):
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.period / self.capacity
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def update(self, headers, status, now):
+        try:
+            if "X-RateLimit-Remaining" in headers and "X-RateLimit-Reset-After" in headers:
+                limit = max(1, int(headers.get("X-RateLimit-Limit", self.capacity)))
+                remaining = int(headers["X-RateLimit-Remaining"])
+                reset_after = float(headers["X-RateLimit-Reset-After"])
+                # Première requête de la fenêtre : le délai restant est la durée complète de la fenêtre
+                if remaining == limit - 1 and reset_after > 0:
+                    self.period = reset_after
+                self.capacity = limit
+                self.tokens = min(self.tokens, remaining)
+                self.updated = now
+                if remaining == 0:
+                    self.blocked_until = max(self.blocked_until, now + reset_after)
+            if status == 429 and "Retry-After" in headers:
+                self.blocked_until = max(self.blocked_until, now + float(headers["Retry-After"]))
+        except ValueError:
+            pass
+
+class SendScheduler:
+    def __init__(self, workers):
+        self.worker_count = workers
+        self.workers = []
+        self.queue = None
+        self.order = itertools.count()
+        self.buckets = {}
+        self.global_blocked_until = 0.0
+        self.depth = Counter()
+        self.sent = Counter()
+        self.failed = Counter()
+        self.wait_seconds = Counter()
+        self.rate_limited = 0
+        self.active = 0
+        # Envois hors copies en cours, et ceux mis de côté faute de worker disponible pour eux
+        self.background_limit = max(1, workers - SEND_RELAY_RESERVED)
+        self.background_active = 0
+        self.held = deque()
+
+    def _loop_time(self):
+        return asyncio.get_running_loop().time()
+
+    def bucket(self, route, now):
+        bucket = self.buckets.get(route)
+        if bucket is None:
+            capacity, period = DEFAULT_ROUTE_LIMITS.get(route[0], DEFAULT_ROUTE_LIMIT)
+            bucket = self.buckets[route] = RouteBucket(capacity, period, now)
+        return bucket
+
+    def start(self):
+        self.queue = asyncio.PriorityQueue()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    # Exécute `factory()` (une coroutine d'envoi) quand la route le permet, par ordre de priorité
+    async def submit(self, priority, route, factory):
+        if not self.workers:
+            self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.depth[priority] += 1
+        # Span de l'appelant : l'attente et la requête y sont rattachées
+        parent = relay_tracing.current_span.get()
+        self.queue.put_nowait((priority, next(self.order), route, factory, future, loop.time(), parent))
+        return await future
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        # Le worker a pu être créé depuis un span : il n'en hérite pas
+        relay_tracing.current_span.set(None)
+        while True:
+            item = await self.queue.get()
+            priority, _, route, factory, future, queued_at, parent = item
+            if future.cancelled():
+                self.depth[priority] -= 1
+                continue
+            background = priority != PRIORITY_RELAY
+            if background and self.background_active >= self.background_limit:
+                # Repris dès qu'un envoi hors copies se termine
+                self.held.append(item)
+                continue
+            now = loop.time()
+            bucket = self.bucket(route, now)
+            wait = max(bucket.wait_time(now), self.global_blocked_until - now)
+            if wait > 0:
+                # La route est saturée : on remet la tâche en file sans bloquer les autres routes
+                loop.call_later(wait, self.queue.put_nowait, item)
+                continue
+            bucket.take(now)
+            self.depth[priority] -= 1
+            self.wait_seconds[LANE_NAMES[priority]] += now - queued_at
+            relay_tracing.record_span("rate_limit_wait", now - queued_at, parent, route=route[0])
+            self.active += 1
+            if background:
+                self.background_active += 1
+            try:
+                with relay_tracing.span("http", parent=parent, route=route[0]):
+                    result = await factory()
+            except Exception as e:
+                self.failed[LANE_NAMES[priority]] += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.sent[LANE_NAMES[priority]] += 1
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self.active -= 1
+                if background:
+                    self.background_active -= 1
+                    if self.held:
+                        self.queue.put_nowait(self.held.popleft())
+
+    # Plus aucun envoi en file ni en cours
+    def idle(self):
+        return not self.active and not any(self.depth.values())
+
+    # Appelé pour chaque réponse HTTP de Discord (bot et webhooks)
+    def observe(self, method, path, status, headers):
+        now = self._loop_time()
+        if status == 429:
+            self.rate_limited += 1
+            if headers.get("X-RateLimit-Global") and "Retry-After" in headers:
+                self.global_blocked_until = now + float(headers["Retry-After"])
+        for route_method, pattern, kind in ROUTE_PATTERNS:
+            if route_method in (None, method):
+                match = pattern.search(path)
+                if match:
+                    self.bucket((kind, int(match.group(1))), now).update(headers, status, now)
+                    return
+
+    def metrics(self):
+        return {
+            "queue_depth": {LANE_NAMES[p]: self.depth[p] for p in LANE_NAMES},
+            "sent": dict(self.sent),
+            "failed": dict(self.failed),
+            "wait_seconds": {lane: round(seconds, 3) for lane, seconds in list(self.wait_seconds.items())},
+            "rate_limited": self.rate_limited,
+            "routes": len(self.buckets),
+            "held_background": len(self.held),
+        }
+
+scheduler = SendScheduler(SEND_WORKERS)
+
+async def on_discord_response(session, context, params):
+    scheduler.observe(params.method, params.url.path, params.response.status, params.response.headers)
+
+rate_limit_trace = aiohttp.TraceConfig()
+rate_limit_trace.on_request_end.append(on_discord_response)
+
+# Raccourci pour passer un envoi par l'ordonnanceur
+def schedule(priority, route, factory):
+    return scheduler.submit(priority, route, factory)
+
+# Arrêt propre (SIGTERM) : une fois shutdown_event levé, plus aucun nouvel événement
+# n'est traité et les attentes avant suppression sont écourtées
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))
+shutdown_event = asyncio.Event()
+# Suppressions différées en attente, menées à terme avant l'arrêt
+cleanup_tasks = set()
+# Autres tâches lancées sans être attendues (rattrapages, places abandonnées, messages
+# privés...) : référencées jusqu'à leur fin pour ne pas être détruites en cours de route
+background_tasks = set()
+
+def report_task_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Erreur dans la tâche {task.get_name()} : {task.exception()}", exc_info=task.exception())
+
+def track_task(coroutine, tasks=background_tasks):
+    task = asyncio.create_task(coroutine)
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    task.add_done_callback(report_task_error)
+    return task
+
+def track_cleanup(coroutine):
+    return track_task(coroutine, cleanup_tasks)
+
+async def sleep_until_shutdown(delay):
+    try:
+        await asyncio.wait_for(shutdown_event.wait(), delay)
+    except asyncio.TimeoutError:
+        pass
+
+# Supprime un message après un délai, dans la file de nettoyage
+async def delete_later(message, delay):
+    # Hors de la trace qui a créé le message : la suppression arrive bien après
+    relay_tracing.current_span.set(None)
+    await sleep_until_shutdown(delay)
+    try:
+        await schedule(PRIORITY_CLEANUP, ("delete", message.channel.id), message.delete)
+    except discord.HTTPException as e:
+        logger.error(f"Erreur lors de la suppression du message {message.id} : {e}")
+
+# Configuration du bot Discord
+# CLIENT_PROFILE=lean (par défaut) ne demande que les intents utiles au relais et
+# désactive le cache des membres et le chunking des serveurs : la mémoire ne grossit
+# plus avec la taille des serveurs. CLIENT_PROFILE=full reprend les intents par défaut.
+# MESSAGE_CACHE_SIZE borne le cache de messages de discord.py, qui ne sert qu'aux
+# réactions d'event-test (les modifications passent par l'événement brut). Il doit
+# rester positif : discord.py traite 0 comme « pas de cache » et ignorerait alors
+# toutes les réactions.
+CLIENT_PROFILE = os.getenv("CLIENT_PROFILE", "lean")
+MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", "250"))
+if MESSAGE_CACHE_SIZE < 1:
+    raise ValueError("MESSAGE_CACHE_SIZE doit être au moins 1, sinon les réactions ne sont plus reçues")
+if CLIENT_PROFILE == "full":
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.reactions = True  # Pour gérer les réactions dans event-test
+    client_options = {}
+else:
+    intents = discord.Intents.none()
+    intents.guilds = True  # Salons et noms de salons, pour le routage
+    intents.guild_messages = True
+    intents.message_content = True
+    intents.guild_reactions = True  # Réactions dans event-test, activité des salons
+    intents.dm_messages = True  # Commande !langue en message privé
+    # La frappe ne sert qu'à réveiller les salons inactifs (RELAY_IDLE_AFTER)
+    intents.guild_typing = float(os.getenv("RELAY_IDLE_AFTER", "0")) > 0
+    client_options = {
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+        "max_messages": MESSAGE_CACHE_SIZE,
+    }
+
+# Sharding : SHARD_COUNT (nombre total de shards, ou "auto" pour laisser Discord
+# choisir) active AutoShardedClient ; SHARD_IDS ("0,1" ou "0-3", avec un SHARD_COUNT
+# explicite) limite ce processus à une partie des shards pour répartir les serveurs
+# entre plusieurs processus. Chacun a alors ses propres fichiers d'état (shard_path).
+def parse_shard_ids(value):
+    shard_ids = []
+    for item in value.split(","):
+        item = item.strip()
+        if "-" in item:
+            first, last = item.split("-")
+            shard_ids.extend(range(int(first), int(last) + 1))
+        elif item:
+            shard_ids.append(int(item))
+    return shard_ids or None
+
+SHARD_COUNT = os.getenv("SHARD_COUNT", "")
+SHARD_IDS = parse_shard_ids(os.getenv("SHARD_IDS", ""))
+if SHARD_IDS:
+    # Sans nombre total, chaque processus se connecterait à tous les serveurs
+    if not SHARD_COUNT or SHARD_COUNT == "auto":
+        raise ValueError("SHARD_IDS demande un SHARD_COUNT explicite")
+    if max(SHARD_IDS) >= int(SHARD_COUNT):
+        raise ValueError(f"SHARD_IDS doit être compris entre 0 et {int(SHARD_COUNT) - 1}")
+
+# Fichier d'état propre à ce processus quand il ne gère qu'une partie des shards :
+# "relay_journal.db" devient par exemple "relay_journal.shards-0-1.db"
+def shard_path(path):
+    if not path or not SHARD_IDS:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.shards-{'-'.join(map(str, SHARD_IDS))}{extension}"
+
+if SHARD_COUNT:
+    client = discord.AutoShardedClient(
+        intents=intents,
+        http_trace=rate_limit_trace,
+        shard_count=None if SHARD_COUNT == "auto" else int(SHARD_COUNT),
+        shard_ids=SHARD_IDS,
+        **client_options,
+    )
+else:
+    client = discord.Client(intents=intents, http_trace=rate_limit_trace, **client_options)
+
+# Configuration des salons et langues
+channels = {
+    "general": "en",
+    "general-fr": "fr",
+    "general-en": "en",
+    "general-es": "es",
+    "general-uk": "uk",
+    "general-br": "pt",
+    "general-cn": "zh-cn",
+    "general-de": "de",
+    "general-kr": "ko"
+}
+
+# Mapping des drapeaux aux langues pour event-test (6 langues demandées)
+lang_map = {
+    '🇫🇷': 'fr',  # Français
+    '🇬🇧': 'en',  # Anglais
+    '🇪🇸': 'es',  # Espagnol
+    '🇺🇦': 'uk',  # Ukrainien
+    '🇩🇪': 'de',  # Allemand
+    '🇰🇷': 'ko'   # Coréen
+}
+
+# Configuration par serveur : GUILD_CONFIG_FILE (JSON) associe l'id d'un serveur à
+# ses salons de relais, ses drapeaux et son salon d'événements, par exemple
+#   {"default": {"channels": {"general-fr": "fr", "general-en": "en"}},
+#    "123": {"channels": {"chat-fr": "fr", "chat-en": "en"}, "flags": {"🇫🇷": "fr"}, "event_channel": "annonces"}}
+# La section "default" remplace la configuration ci-dessus pour tous les serveurs
+# absents du fichier. Le fichier est relu à chaud dès qu'il change (CONFIG_RELOAD_INTERVAL,
+# en secondes) ; une version invalide est ignorée et l'ancienne configuration conservée.
+GUILD_CONFIG_FILE = os.getenv("GUILD_CONFIG_FILE", "guilds.json")
+CONFIG_RELOAD_INTERVAL = float(os.getenv("CONFIG_RELOAD_INTERVAL", "5"))
+LANG_CODE = re.compile(r"^[a-z]{2,3}(-[a-z]{2,4})?$")
+
+class GuildConfig:
+    __slots__ = ("channels", "lang_map", "event_channel", "routes")
+
+    def __init__(self, channels, lang_map, event_channel="event-test"):
+        self.channels = channels
+        self.lang_map = lang_map
+        self.event_channel = event_channel
+        # id du serveur -> table de routage compilée (voir compile_routes)
+        self.routes = {}
+
+    # Table de routage d'un serveur : id du salon source -> (langue du salon,
+    # ((salon cible, langue cible), ...)), dans l'ordre de la configuration
+    def compile_routes(self, guild):
+        by_name = {}
+        for channel in guild.text_channels:
+            if channel.name in self.channels and channel.name not in by_name:
+                by_name[channel.name] = channel
+        relay_channels = [by_name[name] for name in self.channels if name in by_name]
+        return {
+            source.id: (
+                self.channels[source.name],
+                tuple((target, self.channels[target.name]) for target in relay_channels if target is not source),
+            )
+            for source in relay_channels
+        }
+
+    # La table est compilée une fois par chargement de la configuration, puis à chaque
+    # création, suppression ou renommage de salon (invalidate_routes). Un salon absent de
+    # la table (hors configuration, ou doublon d'un nom déjà pris) ne la recompile pas.
+    def route(self, channel):
+        routes = self.routes.get(channel.guild.id)
+        if routes is None:
+            routes = self.routes[channel.guild.id] = self.compile_routes(channel.guild)
+        return routes.get(channel.id, (self.channels.get(channel.name), ()))
+
+def parse_guild_config(section, base):
+    if not isinstance(section, dict):
+        raise ValueError("chaque section doit être un objet")
+    config = GuildConfig(
+        section.get("channels", base.channels),
+        section.get("flags", base.lang_map),
+        section.get("event_channel", base.event_channel),
+    )
+    for key, mapping in (("channels", config.channels), ("flags", config.lang_map)):
+        if not isinstance(mapping, dict) or not mapping:
+            raise ValueError(f"{key} doit être un objet non vide")
+        for name, lang in mapping.items():
+            if not isinstance(lang, str) or not LANG_CODE.match(lang):
+                raise ValueError(f"{key} : code de langue invalide pour {name!r} : {lang!r}")
+    if not isinstance(config.event_channel, str) or not config.event_channel:
+        raise ValueError("event_channel doit être un nom de salon")
+    if config.event_channel in config.channels:
+        raise ValueError(f"le salon {config.event_channel!r} ne peut pas être à la fois relais et événements")
+    return config
+
+builtin_config = GuildConfig(channels, lang_map)
+
+# Lit et valide le fichier complet ; lève une exception plutôt que de renvoyer une
+# configuration partielle
+def load_guild_configs():
+    try:
+        with open(GUILD_CONFIG_FILE, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return builtin_config, {}
+    if not isinstance(data, dict):
+        raise ValueError("le fichier doit contenir un objet")
+    default = parse_guild_config(data.get("default", {}), builtin_config)
+    configs = {}
+    for guild_id, section in data.items():
+        if guild_id == "default":
+            continue
+        if not guild_id.isdigit():
+            raise ValueError(f"id de serveur invalide : {guild_id!r}")
+        configs[int(guild_id)] = parse_guild_config(section, default)
+    return default, configs
+
+default_config = builtin_config
+guild_configs = {}
+config_mtime = None
+config_watcher = None
+
+# Recharge la configuration si le fichier a changé. Les nouvelles tables remplacent
+# les anciennes d'un seul coup : un relais en cours garde celles avec lesquelles il a démarré.
+def reload_guild_configs():
+    global default_config, guild_configs, config_mtime
+    try:
+        mtime = os.stat(GUILD_CONFIG_FILE).st_mtime_ns
+    except OSError:
+        mtime = None
+    if mtime == config_mtime:
+        return False
+    config_mtime = mtime
+    try:
+        default, configs = load_guild_configs()
+    except (OSError, ValueError, AttributeError) as e:
+        logger.error(f"Configuration {GUILD_CONFIG_FILE} invalide, l'ancienne est conservée : {e}")
+        return False
+    default_config, guild_configs = default, configs
+    logger.info(f"Configuration chargée : {len(configs)} serveur(s) configuré(s), {len(default.channels)} salon(s) par défaut")
+    return True
+
+async def watch_guild_configs():
+    while True:
+        await asyncio.sleep(CONFIG_RELOAD_INTERVAL)
+        reload_guild_configs()
+
+reload_guild_configs()
+
+def config_for(guild):
+    if guild is None:
+        return default_config
+    return guild_configs.get(guild.id, default_config)
+
+# Salons créés, supprimés ou renommés : la table de routage du serveur est recompilée
+def invalidate_routes(guild):
+    config_for(guild).routes.pop(guild.id, None)
+
+# Détection locale de la langue par trigrammes de caractères.
+# Les profils sont construits une seule fois au chargement à partir de courts
+# textes de référence ; le coréen, le chinois et le japonais sont reconnus
+# directement par leur écriture.
+LANGUAGE_SAMPLES = {
+    "en": (
+        "hello everyone, how are you doing today? i think we should meet tonight for the raid. "
+        "does anyone know where the event is? thanks for the help, that was really nice of you. "
+        "what time is it there? i will be online later with my friends and we can play together. "
+        "the new update looks great but there are still some bugs. please let me know if you need anything. "
+        "good morning, have a nice day and see you soon. this is the best guild in the world."
+    ),
+    "fr": (
+        "bonjour tout le monde, comment ça va aujourd'hui ? je pense qu'on devrait se retrouver ce soir pour le raid. "
+        "est-ce que quelqu'un sait où se trouve l'événement ? merci pour l'aide, c'était vraiment gentil de ta part. "
+        "quelle heure est-il chez vous ? je serai en ligne plus tard avec mes amis et nous pourrons jouer ensemble. "
+        "la nouvelle mise à jour est très bien mais il reste encore des bugs. dites-moi si vous avez besoin de quelque chose. "
+        "bonne journée et à bientôt, c'est la meilleure guilde du monde."
+    ),
+    "es": (
+        "hola a todos, ¿cómo estáis hoy? creo que deberíamos reunirnos esta noche para la incursión. "
+        "¿alguien sabe dónde es el evento? gracias por la ayuda, fue muy amable de tu parte. "
+        "¿qué hora es allí? estaré conectado más tarde con mis amigos y podemos jugar juntos. "
+        "la nueva actualización se ve genial pero todavía hay algunos errores. avisadme si necesitáis algo. "
+        "buenos días, que tengas un buen día y hasta pronto. este es el mejor gremio del mundo."
+    ),
+    "pt": (
+        "olá a todos, como vocês estão hoje? acho que devemos nos encontrar esta noite para a raid. "
+        "alguém sabe onde é o evento? obrigado pela ajuda, foi muito gentil da sua parte. "
+        "que horas são aí? vou estar online mais tarde com meus amigos e podemos jogar juntos. "
+        "a nova atualização está ótima mas ainda tem alguns problemas. me avisem se precisarem de alguma coisa. "
+        "bom dia, tenham um ótimo dia e até logo. esta é a melhor guilda do mundo, não é?"
+    ),
+    "de": (
+        "hallo zusammen, wie geht es euch heute? ich denke, wir sollten uns heute abend für den raid treffen. "
+        "weiß jemand, wo das event stattfindet? danke für die hilfe, das war wirklich nett von dir. "
+        "wie spät ist es bei euch? ich bin später mit meinen freunden online und wir können zusammen spielen. "
+        "das neue update sieht toll aus, aber es gibt noch einige fehler. sagt mir bitte, wenn ihr etwas braucht. "
+        "guten morgen, einen schönen tag noch und bis bald. das ist die beste gilde der welt."
+    ),
+    "uk": (
+        "привіт усім, як у вас справи сьогодні? я думаю, нам варто зустрітися сьогодні ввечері для рейду. "
+        "хтось знає, де відбувається подія? дякую за допомогу, це було дуже мило з твого боку. "
+        "котра у вас година? я буду в мережі пізніше з моїми друзями, і ми можемо пограти разом. "
+        "нове оновлення виглядає чудово, але ще є деякі помилки. дайте знати, якщо вам щось потрібно. "
+        "доброго ранку, гарного дня і до зустрічі. це найкраща гільдія у світі, чи не так?"
+    ),
+    "ru": (
+        "привет всем, как у вас дела сегодня? я думаю, нам стоит встретиться сегодня вечером для рейда. "
+        "кто-нибудь знает, где проходит событие? спасибо за помощь, это было очень мило с твоей стороны. "
+        "который у вас час? я буду в сети позже с моими друзьями, и мы сможем поиграть вместе. "
+        "новое обновление выглядит отлично, но ещё есть несколько ошибок. дайте знать, если вам что-то нужно. "
+        "доброе утро, хорошего дня и до встречи. это лучшая гильдия в мире, не так ли?"
+    ),
+}
+
+LATIN_LANGUAGES = ("en", "fr", "es", "pt", "de")
+CYRILLIC_LANGUAGES = ("uk", "ru")
+DETECTION_MIN_LETTERS = int(os.getenv("DETECTION_MIN_LETTERS", "6"))
+DETECTION_MIN_MARGIN = float(os.getenv("DETECTION_MIN_MARGIN", "0.1"))
+NOISE_PATTERN = re.compile(r"<[^>]*>|https?://\S+|:[\w~]+:")
+
+def _trigrams(text):
+    cleaned = "".join(c if c.isalpha() or c == "'" else " " for c in text.lower())
+    for word in cleaned.split():
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            yield padded[i:i + 3]
+
+def _build_language_profiles():
+    counts = {}
+    for lang, sample in LANGUAGE_SAMPLES.items():
+        lang_counts = {}
+        for gram in _trigrams(sample):
+            lang_counts[gram] = lang_counts.get(gram, 0) + 1
+        counts[lang] = lang_counts
+    vocabulary = len({gram for lang_counts in counts.values() for gram in lang_counts})
+    profiles = {}
+    for lang, lang_counts in counts.items():
+        total = sum(lang_counts.values()) + vocabulary
+        profiles[lang] = (
+            {gram: math.log((count + 1) / total) for gram, count in lang_counts.items()},
+            math.log(1 / total),
+        )
+    return profiles
+
+language_profiles = _build_language_profiles()
+
+# Renvoie le code googletrans de la langue du texte, ou None si la détection
+# n'est pas assez sûre (texte trop court, langues trop proches)
+def detect_language(text):
+    if not text:
+        return None
+    text = NOISE_PATTERN.sub(" ", text)
+    hangul = han = kana = cyrillic = latin = 0
+    for c in text:
+        if not c.isalpha():
+            continue
+        code = ord(c)
+        if 0xAC00 <= code <= 0xD7AF or 0x1100 <= code <= 0x11FF or 0x3130 <= code <= 0x318F:
+            hangul += 1
+        elif 0x3040 <= code <= 0x30FF:
+            kana += 1
+        elif 0x4E00 <= code <= 0x9FFF or 0x3400 <= code <= 0x4DBF:
+            han += 1
+        elif 0x0400 <= code <= 0x04FF:
+            cyrillic += 1
+        elif code < 0x0250:
+            latin += 1
+    letters = hangul + han + kana + cyrillic + latin
+    if letters == 0:
+        return None
+    if hangul * 2 >= letters:
+        return "ko"
+    if kana and (kana + han) * 2 >= letters:
+        return "ja"
+    if han * 2 >= letters:
+        return "zh-cn"
+    if letters < DETECTION_MIN_LETTERS:
+        return None
+    candidates = CYRILLIC_LANGUAGES if cyrillic > latin else LATIN_LANGUAGES
+    scores = dict.fromkeys(candidates, 0.0)
+    grams = 0
+    for gram in _trigrams(text):
+        grams += 1
+        for lang in candidates:
+            log_probs, unseen = language_profiles[lang]
+            scores[lang] += log_probs.get(gram, unseen)
+    if grams == 0:
+        return None
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    if (scores[ranked[0]] - scores[ranked[1]]) / grams < DETECTION_MIN_MARGIN:
+        return None
+    return ranked[0]
+
+# Les appels à googletrans sont bloquants : ils tournent dans un pool de threads
+# (un Translator par thread) pour ne pas geler la boucle d'événements. Avec
+# TRANSLATION_PROCESSES > 0, ils partent dans autant de processus séparés : la
+# traduction n'est plus soumise au GIL du processus qui tient la connexion Discord,
+# et un processus lent ne peut plus retarder les battements de cœur de la passerelle.
+TRANSLATION_WORKERS = int(os.getenv("TRANSLATION_WORKERS", "4"))
+TRANSLATION_PROCESSES = int(os.getenv("TRANSLATION_PROCESSES", "0"))
+blocking_translate = translation_worker.translate
+
+def create_translation_executor():
+    if TRANSLATION_PROCESSES > 0:
+        # "spawn" : pas de fork d'un processus qui a déjà des threads en cours. Les
+        # processus ne chargent que main.py (réduit au point d'entrée) et translation_worker.py
+        return ProcessPoolExecutor(
+            max_workers=TRANSLATION_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=translation_worker.warm_up,
+        )
+    return ThreadPoolExecutor(max_workers=TRANSLATION_WORKERS, thread_name_prefix="traduction")
+
+translation_executor = create_translation_executor()
+
+async def run_translation(text, src, dest):
+    global translation_executor
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(translation_executor, blocking_translate, text, src, dest)
+    except BrokenExecutor:
+        # Un processus de traduction est mort : on recrée le pool et on réessaie une fois
+        logger.error("Pool de traduction hors service, redémarrage")
+        translation_executor = create_translation_executor()
+        return await loop.run_in_executor(translation_executor, blocking_translate, text, src, dest)
+
+# Cache LRU des traductions, indexé par (langue source, langue cible, texte)
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "2000"))
+translation_cache = OrderedDict()
+# Traductions en cours : une même demande simultanée ne part qu'une fois
+translations_in_flight = {}
+
+# Comptabilité des traductions : requêtes et caractères envoyés au traducteur
+# (upstream), servis par le cache (cached) ou par une demande identique déjà en cours
+# (shared), par chemin (relay, edit, backlog, reaction, dm), salon source et langue
+# cible, plus les caractères demandés par utilisateur. La fenêtre courante est ajoutée
+# aux totaux et écrite dans USAGE_FILE (JSONL, vide pour désactiver) toutes les
+# USAGE_FLUSH_INTERVAL secondes ; le tout est consultable sur /usage.
+# TRANSLATION_BUDGETS ("general-fr:50000,general-kr:20000") plafonne les caractères
+# envoyés au traducteur par salon source et par TRANSLATION_BUDGET_WINDOW secondes :
+# au-delà, le salon passe en relais dégradé (copies non traduites) jusqu'à la fenêtre suivante.
+USAGE_FILE = shard_path(os.getenv("USAGE_FILE", "translation_usage.jsonl"))
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "60"))
+USAGE_TOP_USERS = int(os.getenv("USAGE_TOP_USERS", "20"))
+TRANSLATION_BUDGET_WINDOW = float(os.getenv("TRANSLATION_BUDGET_WINDOW", "86400"))
+
+def parse_channel_budgets(value):
+    budgets = {}
+    for item in value.split(","):
+        name, _, limit = item.strip().partition(":")
+        if name and limit:
+            budgets[name] = int(limit)
+    return budgets
+
+TRANSLATION_BUDGETS = parse_channel_budgets(os.getenv("TRANSLATION_BUDGETS", ""))
+# (chemin, salon source, utilisateur) de la traduction en cours, hérité par les tâches
+usage_context = ContextVar("usage_context", default=("other", None, None))
+
+@contextmanager
+def usage_scope(path, channel, user=None):
+    token = usage_context.set((path, channel, user))
+    try:
+        yield
+    finally:
+        usage_context.reset(token)
+
+class TranslationUsage:
+    def __init__(self):
+        # (chemin, salon, langue cible) -> compteurs
+        self.window = defaultdict(Counter)
+        self.totals = defaultdict(Counter)
+        # Volume par id d'utilisateur (deux homonymes ne se confondent pas, un renommage
+        # ne coupe pas le compte) ; le nom le plus récent ne sert qu'à l'affichage
+        self.users = Counter()
+        self.user_names = {}
+        self.window_started = time.time()
+        # id du salon source -> (nom, début de la fenêtre de budget, caractères envoyés)
+        self.spent = {}
+        self.degraded = Counter()
+
+    def record(self, kind, text, dest):
+        path, channel, user = usage_context.get()
+        counters = self.window[(path, channel.name if channel is not None else None, dest)]
+        counters[f"{kind}_requests"] += 1
+        counters[f"{kind}_chars"] += len(text)
+        if user is not None and user.id is not None:
+            self.users[user.id] += len(text)
+            self.user_names[user.id] = user.name
+        if kind == "upstream" and channel is not None and channel.name in TRANSLATION_BUDGETS:
+            _, started, spent = self._budget_window(channel)
+            self.spent[channel.id] = (channel.name, started, spent + len(text))
+
+    def _budget_window(self, channel):
+        now = time.monotonic()
+        name, started, spent = self.spent.get(channel.id, (channel.name, now, 0))
+        if now - started >= TRANSLATION_BUDGET_WINDOW:
+            return name, now, 0
+        return name, started, spent
+
+    def over_budget(self, channel):
+        budget = TRANSLATION_BUDGETS.get(channel.name)
+        return budget is not None and self._budget_window(channel)[2] >= budget
+
+    # Clôt la fenêtre courante ; renvoie son résumé, ou None si elle est vide
+    def close_window(self):
+        window, users, names = self.window, self.users, self.user_names
+        self.window, self.users, self.user_names = defaultdict(Counter), Counter(), {}
+        entry = {
+            "start": round(self.window_started, 3),
+            "end": round(time.time(), 3),
+            "usage": self.rows(window),
+            "users": self.top_users(users, names),
+        }
+        self.window_started = entry["end"]
+        for key, counters in window.items():
+            self.totals[key].update(counters)
+        return entry if window else None
+
+    @staticmethod
+    def rows(table):
+        return [
+            {"path": path, "channel": channel, "lang": lang, **counters}
+            for (path, channel, lang), counters in list(table.items())
+        ]
+
+    @staticmethod
+    def top_users(users, names):
+        return [
+            {"user_id": str(user_id), "name": names.get(user_id), "chars": chars}
+            for user_id, chars in users.most_common(USAGE_TOP_USERS)
+        ]
+
+    def metrics(self):
+        return {
+            "window_started": round(self.window_started, 3),
+            "window": self.rows(self.window),
+            "totals": self.rows(self.totals),
+            "top_users": self.top_users(Counter(dict(list(self.users.items()))), dict(list(self.user_names.items()))),
+            "budgets": {
+                str(channel_id): {"channel": name, "budget": TRANSLATION_BUDGETS.get(name), "spent": spent}
+                for channel_id, (name, _, spent) in list(self.spent.items())
+            },
+            "degraded_relays": dict(self.degraded),
+        }
+
+translation_usage = TranslationUsage()
+
+def append_usage(entry):
+    with open(USAGE_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+async def flush_usage():
+    entry = translation_usage.close_window()
+    if entry and USAGE_FILE:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, append_usage, entry)
+        except OSError as e:
+            logger.error(f"Impossible d'écrire {USAGE_FILE} : {e}")
+
+async def flush_usage_periodically():
+    while not shutdown_event.is_set():
+        await sleep_until_shutdown(USAGE_FLUSH_INTERVAL)
+        await flush_usage()
+
+# Régulateur des appels au traducteur : un seau de jetons global et un par serveur
+# (TRANSLATION_GLOBAL_LIMIT, TRANSLATION_GUILD_LIMIT, "requêtes:secondes", vide pour
+# désactiver), pour qu'une vague de spam dans un salon ne fasse pas bloquer notre IP
+# par le traducteur pour tout le monde. Chaque appel réserve son jeton et attend son
+# tour (file FIFO) ; les demandes identiques en attente sont fusionnées par
+# translations_in_flight. Si l'attente dépasse TRANSLATION_MAX_WAIT secondes, la
+# demande est refusée (TranslationThrottled) et le relais se dégrade selon
+# TRANSLATION_THROTTLED_POLICY : "untranslated" (copie non traduite) ou "digest"
+# (mise de côté dans le rattrapage du salon cible, traduit plus tard en une fois).
+def parse_rate_limit(value):
+    if not value:
+        return None
+    capacity, _, period = value.partition(":")
+    return int(capacity), float(period or "1")
+
+TRANSLATION_GLOBAL_LIMIT = parse_rate_limit(os.getenv("TRANSLATION_GLOBAL_LIMIT", "20:1"))
+TRANSLATION_GUILD_LIMIT = parse_rate_limit(os.getenv("TRANSLATION_GUILD_LIMIT", "10:1"))
+TRANSLATION_MAX_WAIT = float(os.getenv("TRANSLATION_MAX_WAIT", "10"))
+TRANSLATION_THROTTLED_POLICY = os.getenv("TRANSLATION_THROTTLED_POLICY", "untranslated")
+
+class TranslationThrottled(Exception):
+    pass
+
+class TranslationGovernor:
+    def __init__(self):
+        self.global_bucket = None
+        self.guild_buckets = {}
+        self.waiting = 0
+        self.stats = Counter()
+
+    def buckets(self, guild_id, now):
+        buckets = []
+        if TRANSLATION_GLOBAL_LIMIT:
+            if self.global_bucket is None:
+                self.global_bucket = RouteBucket(*TRANSLATION_GLOBAL_LIMIT, now)
+            buckets.append(self.global_bucket)
+        if TRANSLATION_GUILD_LIMIT and guild_id is not None:
+            bucket = self.guild_buckets.get(guild_id)
+            if bucket is None:
+                bucket = self.guild_buckets[guild_id] = RouteBucket(*TRANSLATION_GUILD_LIMIT, now)
+            buckets.append(bucket)
+        return buckets
+
+    # Réserve un jeton dans chaque seau et attend qu'il soit disponible.
+    # Les jetons peuvent passer en négatif : c'est la file des appels déjà réservés.
+    async def acquire(self, guild_id):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        buckets = self.buckets(guild_id, now)
+        wait = max((bucket.wait_time(now) for bucket in buckets), default=0.0)
+        if wait > TRANSLATION_MAX_WAIT:
+            self.stats["throttled"] += 1
+            raise TranslationThrottled(f"quota de traduction épuisé (attente estimée {wait:.1f} s)")
+        for bucket in buckets:
+            bucket.take(now)
+        if wait > 0:
+            self.stats["queued"] += 1
+            self.waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # Appel abandonné avant son tour : son jeton revient aux suivants
+                for bucket in buckets:
+                    bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+                raise
+            finally:
+                self.waiting -= 1
+            relay_tracing.record_span("governor_wait", wait)
+        self.stats["granted"] += 1
+
+    # Jetons disponibles maintenant (négatif : appels en file), calculés sans toucher au seau
+    # car /metrics est servi depuis le thread Flask ; loop.time() suit time.monotonic()
+    @staticmethod
+    def _remaining(bucket):
+        if bucket is None:
+            return None
+        refilled = bucket.tokens + (time.monotonic() - bucket.updated) * bucket.capacity / bucket.period
+        return round(min(bucket.capacity, refilled), 2)
+
+    def metrics(self):
+        return {
+            "global_remaining": self._remaining(self.global_bucket),
+            "guild_remaining": {str(guild_id): self._remaining(bucket) for guild_id, bucket in list(self.guild_buckets.items())},
+            "waiting": self.waiting,
+            "stats": dict(self.stats),
+            "policy": TRANSLATION_THROTTLED_POLICY,
+        }
+
+translation_governor = TranslationGovernor()
+
+# Appel effectif au traducteur, une fois le jeton obtenu. Le contexte (salon, chemin)
+# est celui de la demande qui a lancé la traduction.
+async def governed_translation(text, src, dest):
+    _, channel, _ = usage_context.get()
+    try:
+        await translation_governor.acquire(channel.guild.id if channel is not None and channel.guild else None)
+    except TranslationThrottled:
+        translation_usage.record("throttled", text, dest)
+        raise
+    translation_usage.record("upstream", text, dest)
+    return await run_translation(text, src, dest)
+
+# Traduit un texte en passant par le cache ; sans langue source connue, on
+# tente d'abord la détection locale pour éviter la détection distante
+async def translate_text(text, dest, src=None):
+    src = src or detect_language(text) or "auto"
+    if src == dest:
+        return text
+    key = (src, dest, text)
+    cached = translation_cache.get(key)
+    if cached is not None:
+        translation_cache.move_to_end(key)
+        translation_usage.record("cached", text, dest)
+        return cached
+    pending = translations_in_flight.get(key)
+    if pending is not None:
+        translation_usage.record("shared", text, dest)
+        with relay_tracing.span("translate", lang=dest, shared=True):
+            return await asyncio.shield(pending)
+    with relay_tracing.span("translate", lang=dest, source=src, chars=len(text)):
+        pending = translations_in_flight[key] = asyncio.ensure_future(governed_translation(text, src, dest))
+        try:
+            translated = await pending
+        finally:
+            translations_in_flight.pop(key, None)
+    translation_cache[key] = translated
+    if len(translation_cache) > TRANSLATION_CACHE_SIZE:
+        translation_cache.popitem(last=False)
+    return translated
+
+# Nombre de clics par drapeau et par salon, pour semer d'abord les drapeaux les plus utilisés
+flag_clicks = defaultdict(Counter)
+
+# Drapeaux à proposer sous un message : on retire celui de la langue du message
+# et on trie les autres par popularité dans le salon
+def flags_to_seed(message):
+    source_lang = detect_language(message.content)
+    clicks = flag_clicks[message.channel.id]
+    flags = [flag for flag, lang in config_for(message.guild).lang_map.items() if lang != source_lang]
+    return sorted(flags, key=lambda flag: -clicks[flag])
+
+# Réponses aux drapeaux regroupées par (message, langue) : les clics reçus pendant
+# la fenêtre s'ajoutent à la même réponse, dont la suppression est repoussée
+REPLY_WINDOW = float(os.getenv("REPLY_WINDOW", "10"))
+REPLY_EDIT_DELAY = float(os.getenv("REPLY_EDIT_DELAY", "1"))
+pending_replies = {}
+
+class PendingReply:
+    __slots__ = ("mentions", "translated", "reply", "deadline", "edit_task")
+
+    def __init__(self, user):
+        self.mentions = [user.mention]
+        self.translated = None
+        self.reply = None
+        self.deadline = asyncio.get_running_loop().time() + REPLY_WINDOW
+        self.edit_task = None
+
+    def content(self):
+        return f"{' '.join(self.mentions)} {self.translated}"
+
+    def add(self, user):
+        self.deadline = asyncio.get_running_loop().time() + REPLY_WINDOW
+        if user.mention not in self.mentions:
+            self.mentions.append(user.mention)
+            # Une seule modification pour tous les clics arrivés pendant REPLY_EDIT_DELAY
+            if self.reply and self.edit_task is None:
+                self.edit_task = asyncio.create_task(self.edit_later())
+
+    async def edit_later(self):
+        await asyncio.sleep(REPLY_EDIT_DELAY)
+        self.edit_task = None
+        try:
+            await schedule(PRIORITY_REPLY, ("edit", self.reply.channel.id), lambda: self.reply.edit(content=self.content()))
+        except discord.HTTPException as e:
+            logger.error(f"Erreur lors de la mise à jour de la réponse {self.reply.id} : {e}")
+
+# Supprime la réponse groupée une fois la fenêtre écoulée sans nouveau clic
+async def expire_reply(key, entry):
+    relay_tracing.current_span.set(None)
+    loop = asyncio.get_running_loop()
+    while entry.deadline > loop.time() and not shutdown_event.is_set():
+        await sleep_until_shutdown(entry.deadline - loop.time())
+    pending_replies.pop(key, None)
+    if entry.edit_task:
+        entry.edit_task.cancel()
+    try:
+        await schedule(PRIORITY_CLEANUP, ("delete", entry.reply.channel.id), entry.reply.delete)
+    except discord.HTTPException as e:
+        logger.error(f"Erreur lors de la suppression de la réponse {entry.reply.id} : {e}")
+
+# Langue préférée de chaque utilisateur, par serveur (id du serveur -> id de
+# l'utilisateur -> code langue), apprise à partir de ses clics ou fixée avec
+# "!langue <code>", et conservée dans un petit fichier JSON. Les traductions privées
+# d'un post ne partent qu'aux utilisateurs inscrits dans le serveur du post.
+PREFERENCES_FILE = shard_path(os.getenv("PREFERENCES_FILE", "preferences.json"))
+PREFERENCE_CLICKS = int(os.getenv("PREFERENCE_CLICKS", "3"))
+PREFERENCE_SAVE_DELAY = float(os.getenv("PREFERENCE_SAVE_DELAY", "5"))
+# (id du serveur, id de l'utilisateur) -> (langue, clics consécutifs)
+click_streaks = {}
+# id de l'utilisateur -> utilisateur, pour les messages privés sans appel à l'API
+# (le profil lean ne garde pas les membres en cache)
+preference_users = {}
+preference_save_task = None
+
+def load_preferences():
+    try:
+        with open(PREFERENCES_FILE, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.error(f"Impossible de lire {PREFERENCES_FILE} : {e}")
+        return {}
+    # Ancien format, sans serveur : on ne sait plus dans quels serveurs envoyer
+    if any(not isinstance(users, dict) for users in data.values()):
+        logger.warning(f"{PREFERENCES_FILE} est à l'ancien format (sans serveur), préférences ignorées")
+        return {}
+    return {
+        int(guild_id): {int(user_id): lang for user_id, lang in users.items()}
+        for guild_id, users in data.items()
+    }
+
+user_preferences = load_preferences()
+
+# Copie des préférences, faite sur la boucle d'événements : l'écriture tourne dans un
+# thread et ne doit pas parcourir les dictionnaires que la boucle modifie
+def preferences_snapshot():
+    return {str(guild_id): {str(user_id): lang for user_id, lang in users.items()} for guild_id, users in user_preferences.items()}
+
+def write_preferences(snapshot):
+    tmp_path = f"{PREFERENCES_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, separators=(",", ":"))
+    os.replace(tmp_path, PREFERENCES_FILE)
+
+# Les écritures sont regroupées : une seule sauvegarde par PREFERENCE_SAVE_DELAY
+async def save_preferences_later():
+    global preference_save_task
+    await asyncio.sleep(PREFERENCE_SAVE_DELAY)
+    preference_save_task = None
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, write_preferences, preferences_snapshot())
+    except OSError as e:
+        logger.error(f"Impossible d'écrire {PREFERENCES_FILE} : {e}")
+
+def set_preference(guild_id, user, lang):
+    global preference_save_task
+    if lang is None:
+        users = user_preferences.get(guild_id, {})
+        users.pop(user.id, None)
+        if not users:
+            user_preferences.pop(guild_id, None)
+        if not any(user.id in users for users in user_preferences.values()):
+            preference_users.pop(user.id, None)
+    else:
+        user_preferences.setdefault(guild_id, {})[user.id] = lang
+        preference_users[user.id] = user
+    if preference_save_task is None:
+        preference_save_task = asyncio.create_task(save_preferences_later())
+
+# Après PREFERENCE_CLICKS clics consécutifs sur la même langue, elle devient la
+# préférence de l'utilisateur dans ce serveur, et il en est prévenu en privé
+def record_click(guild, user, lang):
+    if user_preferences.get(guild.id, {}).get(user.id) == lang:
+        return
+    key = (guild.id, user.id)
+    last_lang, count = click_streaks.get(key, (None, 0))
+    count = count + 1 if last_lang == lang else 1
+    if count >= PREFERENCE_CLICKS:
+        click_streaks.pop(key, None)
+        set_preference(guild.id, user, lang)
+        logger.info(f"Langue préférée de {user.name} apprise dans {guild.name} : {lang}")
+        track_task(notify_enrolment(guild, user, lang))
+    else:
+        click_streaks[key] = (lang, count)
+
+async def notify_enrolment(guild, user, lang):
+    content = (
+        f"Ta langue préférée sur {guild.name} est maintenant « {lang} » : les nouveaux posts de "
+        f"#{config_for(guild).event_channel} te seront envoyés traduits en privé. "
+        f"Envoie « !langue off » pour arrêter, ou « !langue <code> » pour changer de langue."
+    )
+    try:
+        await schedule(PRIORITY_REPLY, ("dm", user.id), lambda: user.send(content))
+    except discord.HTTPException as e:
+        logger.error(f"Impossible de prévenir {user.name} de sa langue préférée : {e}")
+
+# Commande "!langue <code>" (ou "!langue off") pour choisir sa langue de réception.
+# En message privé, elle s'applique à tous les serveurs où l'utilisateur est inscrit.
+async def handle_language_command(message):
+    args = message.content.split()
+    if len(args) != 2:
+        return False
+    lang = args[1].lower()
+    languages = set(config_for(message.guild).lang_map.values())
+    if message.guild is not None:
+        guild_ids = [message.guild.id]
+    else:
+        guild_ids = [guild_id for guild_id, users in user_preferences.items() if message.author.id in users]
+    if lang != "off" and lang not in languages:
+        content = f"{message.author.mention}, langues disponibles : {', '.join(sorted(languages))}"
+    elif not guild_ids and lang != "off":
+        content = "Utilise cette commande dans un serveur pour y choisir ta langue de réception."
+    else:
+        for guild_id in guild_ids:
+            set_preference(guild_id, message.author, None if lang == "off" else lang)
+        await schedule(PRIORITY_REPLY, ("react", message.channel.id), lambda: message.add_reaction("✅"))
+        return True
+    await schedule(PRIORITY_REPLY, ("send", message.channel.id), lambda: message.channel.send(content))
+    return True
+
+# Utilisateur destinataire d'un message privé ; au pire un seul appel à l'API par
+# utilisateur, passé par l'ordonnanceur
+async def preference_user(user_id):
+    user = preference_users.get(user_id) or client.get_user(user_id)
+    if user is None:
+        user = await schedule(PRIORITY_REPLY, ("fetch_user", 0), lambda: client.fetch_user(user_id))
+    preference_users[user_id] = user
+    return user
+
+# Envoie en une passe la traduction d'un nouveau post aux utilisateurs du serveur ayant
+# une langue préférée : une seule traduction par langue, puis un message privé par personne
+async def deliver_to_preferences(message):
+    usage_context.set(("dm", message.channel, message.author))
+    source_lang = detect_language(message.content)
+    recipients = defaultdict(list)
+    for user_id, lang in list(user_preferences.get(message.guild.id, {}).items()):
+        if lang != source_lang and user_id != message.author.id:
+            recipients[lang].append(user_id)
+    for lang, user_ids in recipients.items():
+        try:
+            translated = await translate_text(message.content, lang, src=source_lang)
+        except Exception as e:
+            logger.error(f"Erreur lors de la traduction en {lang} pour les préférences : {e}")
+            continue
+        content = f"**{message.author.name}** ({message.jump_url}) : {translated}"
+        for user_id in user_ids:
+            try:
+                user = await preference_user(user_id)
+                await schedule(PRIORITY_REPLY, ("dm", user_id), lambda: user.send(content))
+            except discord.HTTPException as e:
+                logger.error(f"Impossible d'envoyer la traduction à {user_id} : {e}")
+    if recipients:
+        logger.info(
+            "Traductions envoyées en privé pour %s : %s destinataires", message.id, sum(len(ids) for ids in recipients.values()),
+            extra={"event": "dm_delivered"},
+        )
+
+# Les messages sont découpés en lignes pour ne retraduire que celles qui changent
+def split_segments(text):
+    return text.split("\n") if text else []
+
+# Traduit une liste de segments en un seul appel ; les segments déjà connus
+# (segment -> traduction) ne sont pas renvoyés au traducteur
+async def translate_segments(segments, dest, src, known=None):
+    translations = dict(known or {})
+    missing = [segment for segment in dict.fromkeys(segments) if segment not in translations and segment.strip()]
+    if missing:
+        translated = (await translate_text("\n".join(missing), dest, src=src)).split("\n")
+        if len(translated) == len(missing):
+            translations.update(zip(missing, translated))
+        else:
+            # Le traducteur a fusionné ou coupé des lignes : on traduit segment par segment
+            results = await asyncio.gather(*(translate_text(segment, dest, src=src) for segment in missing))
+            translations.update(zip(missing, results))
+    return [translations.get(segment, segment) for segment in segments]
+
+# Traduction des segments si elle est entièrement disponible dans le cache, sinon None
+def cached_segments(segments, dest, src):
+    if src == dest:
+        return segments
+    missing = [segment for segment in dict.fromkeys(segments) if segment.strip()]
+    if not missing:
+        return segments
+    joined = translation_cache.get((src, dest, "\n".join(missing)))
+    if joined is not None and len(joined.split("\n")) == len(missing):
+        translations = dict(zip(missing, joined.split("\n")))
+    else:
+        translations = {segment: translation_cache.get((src, dest, segment)) for segment in missing}
+        if None in translations.values():
+            return None
+    return [translations.get(segment, segment) for segment in segments]
+
+def format_mirror(message, translated, with_author=True):
+    formatted_message = f"**{message.author.name}**: " if with_author else ""
+    if message.content:
+        formatted_message += translated
+    else:
+        formatted_message += "(Pas de texte)"
+    if message.attachments:
+        attachment_urls = "\n".join([attachment.url for attachment in message.attachments])
+        formatted_message += f"\n{attachment_urls}"
+    return formatted_message
+
+# Correspondance message source -> copies envoyées dans les autres salons, pour
+# propager modifications et suppressions. Bornée aux MIRROR_MAP_SIZE derniers messages.
+MIRROR_MAP_SIZE = int(os.getenv("MIRROR_MAP_SIZE", "2000"))
+mirror_map = OrderedDict()
+
+class MirrorEntry:
+    __slots__ = ("source_lang", "segments", "mirrors", "deferred", "group", "deleted")
+
+    def __init__(self, source_lang, segments):
+        self.source_lang = source_lang
+        self.segments = segments
+        # id du salon cible -> (id de la copie, langue cible, segments traduits, envoyée par webhook)
+        self.mirrors = {}
+        # ids des salons cibles où le message a été mis de côté (rattrapage) au lieu d'être copié
+        self.deferred = []
+        # Rafale de messages fusionnés dans ces copies (voir BurstGroup), sinon None
+        self.group = None
+        # Message source supprimé alors que son relais était en file ou en cours
+        self.deleted = False
+
+# Envoi des copies par webhook (RELAY_WEBHOOKS=1) : un webhook par salon de relais,
+# réutilisé via une session HTTP commune, avec le nom et l'avatar de l'auteur d'origine.
+# Les webhooks ont leur propre limite de débit, indépendante des envois du bot.
+# Un salon où le webhook n'a pas pu être obtenu repasse par le bot pendant
+# WEBHOOK_RETRY_AFTER secondes, puis une nouvelle tentative est faite.
+RELAY_WEBHOOKS = os.getenv("RELAY_WEBHOOKS", "0").lower() in ("1", "true", "yes")
+WEBHOOK_NAME = os.getenv("WEBHOOK_NAME", "Traducteur")
+WEBHOOK_RETRY_AFTER = float(os.getenv("WEBHOOK_RETRY_AFTER", "600"))
+# Code d'erreur de Discord pour un webhook supprimé
+UNKNOWN_WEBHOOK = 10015
+webhook_pool = {}
+# id du salon -> moment du dernier échec
+webhook_failures = {}
+webhook_ids = set()
+webhook_lock = asyncio.Lock()
+webhook_session = None
+
+def webhook_failed_recently(channel):
+    failed_at = webhook_failures.get(channel.id)
+    return failed_at is not None and time.monotonic() - failed_at < WEBHOOK_RETRY_AFTER
+
+# Renvoie le webhook du salon (créé au besoin), ou None si le bot n'a pas la permission
+async def get_webhook(channel):
+    global webhook_session
+    if channel.id in webhook_pool or webhook_failed_recently(channel):
+        return webhook_pool.get(channel.id)
+    async with webhook_lock:
+        if channel.id in webhook_pool or webhook_failed_recently(channel):
+            return webhook_pool.get(channel.id)
+        try:
+            existing = [w for w in await channel.webhooks() if w.name == WEBHOOK_NAME and w.user == client.user]
+            found = existing[0] if existing else await channel.create_webhook(name=WEBHOOK_NAME)
+            if webhook_session is None:
+                webhook_session = aiohttp.ClientSession(trace_configs=[rate_limit_trace])
+            webhook = discord.Webhook.from_url(found.url, session=webhook_session)
+        except discord.HTTPException as e:
+            logger.error(f"Webhook indisponible dans {channel.name}, envoi classique : {e}")
+            webhook_failures[channel.id] = time.monotonic()
+            return None
+        webhook_failures.pop(channel.id, None)
+        webhook_ids.add(webhook.id)
+        webhook_pool[channel.id] = webhook
+        return webhook
+
+# Webhook supprimé hors du bot : retiré du pool, le prochain envoi en obtient un autre
+def forget_webhook(channel, webhook):
+    if webhook_pool.get(channel.id) is webhook:
+        del webhook_pool[channel.id]
+    logger.warning(f"Webhook {webhook.id} supprimé dans {channel.name}, remplacement")
+
+# Envoie une copie et renvoie (id de la copie, envoyée par webhook)
+async def send_mirror(target_channel, message, translated):
+    webhook = await get_webhook(target_channel) if RELAY_WEBHOOKS else None
+    for can_retry in (True, False):
+        if not webhook:
+            break
+        try:
+            mirror = await schedule(PRIORITY_RELAY, ("webhook", webhook.id), lambda: webhook.send(
+                format_mirror(message, translated, with_author=False),
+                username=message.author.display_name,
+                avatar_url=message.author.display_avatar.url,
+                wait=True,
+            ))
+            return mirror.id, True
+        except discord.NotFound:
+            # Une seule nouvelle tentative, avec un nouveau webhook
+            forget_webhook(target_channel, webhook)
+            webhook = await get_webhook(target_channel) if can_retry else None
+        except discord.HTTPException as e:
+            # Certains pseudos sont refusés comme nom de webhook : on repasse par le bot
+            if e.status != 400:
+                raise
+            logger.error(f"Envoi par webhook refusé dans {target_channel.name}, envoi classique : {e}")
+            break
+    content = format_mirror(message, translated)
+    mirror = await schedule(PRIORITY_RELAY, ("send", target_channel.id), lambda: target_channel.send(content))
+    return mirror.id, False
+
+async def edit_mirror(target_channel, mirror_id, via_webhook, message, translated):
+    if via_webhook:
+        webhook = await get_webhook(target_channel)
+        if webhook is None:
+            # Webhook introuvable (WEBHOOK_RETRY_AFTER en cours) : seul lui pourrait modifier la copie
+            logger.warning(f"Copie {mirror_id} dans {target_channel.name} non modifiée : webhook indisponible")
+            return
+        content = format_mirror(message, translated, with_author=False)
+        try:
+            await schedule(PRIORITY_RELAY, ("webhook", webhook.id), lambda: webhook.edit_message(mirror_id, content=content))
+        except discord.NotFound as e:
+            # Seul le webhook d'origine peut modifier la copie : elle reste en l'état
+            if e.code == UNKNOWN_WEBHOOK:
+                forget_webhook(target_channel, webhook)
+            raise
+    else:
+        content = format_mirror(message, translated)
+        mirror = target_channel.get_partial_message(mirror_id)
+        await schedule(PRIORITY_RELAY, ("edit", target_channel.id), lambda: mirror.edit(content=content))
+
+def remember_mirrors(source_id, entry):
+    mirror_map[source_id] = entry
+    if len(mirror_map) > MIRROR_MAP_SIZE:
+        mirror_map.popitem(last=False)
+
+# Ordre des copies : chaque message d'un salon source reçoit un numéro de séquence,
+# et dans chaque salon cible sa copie n'est envoyée qu'après celle du message précédent
+# du même salon source. Les traductions, elles, avancent en parallèle.
+relay_sequences = defaultdict(itertools.count)
+
+class DeliverySequencer:
+    def __init__(self):
+        # (salon source, salon cible) -> (dernier numéro réservé, futur résolu une fois livré)
+        self.tails = {}
+
+    # Réserve la place suivante ; doit être appelé sans attente intermédiaire depuis on_message
+    # pour que l'ordre des réservations soit celui de réception des messages
+    def reserve(self, source_id, target_id, seq):
+        key = (source_id, target_id)
+        previous = self.tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self.tails[key] = (seq, done)
+        return DeliverySlot(self, key, seq, previous[1] if previous else None, done)
+
+    # Livraisons déjà réservées vers un salon cible, toutes sources confondues
+    def pending(self, target_id):
+        return [done for (_, target), (_, done) in list(self.tails.items()) if target == target_id]
+
+    def release(self, slot):
+        if not slot.done.done():
+            slot.done.set_result(None)
+        if self.tails.get(slot.key, (None, None))[1] is slot.done:
+            del self.tails[slot.key]
+
+class DeliverySlot:
+    __slots__ = ("sequencer", "key", "seq", "previous", "done", "gate")
+
+    def __init__(self, sequencer, key, seq, previous, done):
+        self.sequencer = sequencer
+        self.key = key
+        self.seq = seq
+        self.previous = previous
+        self.done = done
+        # Rattrapage du salon cible lancé avant la réservation, à publier avant cette copie
+        self.gate = None
+
+    # Attend que la copie précédente soit livrée (ou abandonnée)
+    async def __aenter__(self):
+        if self.previous is not None:
+            await self.previous
+        return self
+
+    async def __aexit__(self, *exc):
+        self.sequencer.release(self)
+
+    # Abandonne la place sans rien envoyer, toujours après la copie précédente
+    async def abandon(self):
+        async with self:
+            pass
+
+sequencer = DeliverySequencer()
+
+async def untranslated(segments):
+    return segments
+
+# Relais optimiste (RELAY_OPTIMISTIC=1) : la copie part tout de suite avec le texte
+# original (ou RELAY_OPTIMISTIC_PLACEHOLDER), puis est modifiée quand la traduction
+# arrive. Si la traduction est déjà en cache, la copie part directement traduite.
+RELAY_OPTIMISTIC = os.getenv("RELAY_OPTIMISTIC", "0").lower() in ("1", "true", "yes")
+RELAY_OPTIMISTIC_PLACEHOLDER = os.getenv("RELAY_OPTIMISTIC_PLACEHOLDER", "")
+
+async def relay_to_target(message, entry, target_channel, target_lang, slot, translate=True):
+    ready = cached_segments(entry.segments, target_lang, entry.source_lang) if translate else entry.segments
+    if translate and ready is not None and entry.source_lang != target_lang and message.content:
+        translation_usage.record("cached", message.content, target_lang)
+    # La traduction démarre tout de suite ; seul l'envoi attend son tour
+    if ready is not None:
+        translation = asyncio.ensure_future(untranslated(ready))
+    else:
+        translation = asyncio.ensure_future(translate_segments(entry.segments, target_lang, entry.source_lang))
+    optimistic = RELAY_OPTIMISTIC and ready is None and bool(message.content)
+    waiting_since = time.perf_counter()
+    async with slot:
+        relay_tracing.record_span("sequence_wait", time.perf_counter() - waiting_since)
+        # Le rattrapage d'un salon qui se réveille passe avant les copies réservées après lui
+        if slot.gate is not None:
+            await asyncio.shield(slot.gate)
+        if entry.deleted:
+            translation.cancel()
+            return
+        try:
+            if optimistic:
+                early = RELAY_OPTIMISTIC_PLACEHOLDER or message.content
+                mirror_id, via_webhook = await send_mirror(target_channel, message, early)
+                # Traduction pas encore arrivée : rien à réutiliser si le message est modifié d'ici là
+                entry.mirrors[target_channel.id] = (mirror_id, target_lang, None, via_webhook)
+            else:
+                try:
+                    translated = await translation
+                except TranslationThrottled:
+                    if TRANSLATION_THROTTLED_POLICY == "digest":
+                        defer_to_backlog(target_channel, message, entry.source_lang)
+                        entry.deferred.append(target_channel.id)
+                        return
+                    # Copie non traduite : aucune traduction à réutiliser lors d'une modification
+                    mirror_id, via_webhook = await send_mirror(target_channel, message, "\n".join(entry.segments))
+                    entry.mirrors[target_channel.id] = (mirror_id, target_lang, None, via_webhook)
+                    return
+                mirror_id, via_webhook = await send_mirror(target_channel, message, "\n".join(translated))
+                entry.mirrors[target_channel.id] = (mirror_id, target_lang, translated, via_webhook)
+        except Exception as e:
+            optimistic = False
+            translation.cancel()
+            logger.error(f"Erreur lors du traitement du message vers {target_lang} : {e}")
+            await schedule(PRIORITY_REPLY, ("send", target_channel.id), lambda: target_channel.send(f"Erreur : {e}"))
+    if optimistic:
+        # La modification se fait hors de la place réservée : l'ordre des copies est déjà fixé
+        try:
+            try:
+                translated = await translation
+                if entry.deleted:
+                    return
+            except TranslationThrottled:
+                # La copie garde le texte original ; seul un texte d'attente doit être remplacé
+                if RELAY_OPTIMISTIC_PLACEHOLDER:
+                    await edit_mirror(target_channel, mirror_id, via_webhook, message, "\n".join(entry.segments))
+                entry.mirrors[target_channel.id] = (mirror_id, target_lang, None, via_webhook)
+                return
+            await edit_mirror(target_channel, mirror_id, via_webhook, message, "\n".join(translated))
+            entry.mirrors[target_channel.id] = (mirror_id, target_lang, translated, via_webhook)
+        except Exception as e:
+            logger.error(f"Erreur lors de la traduction de la copie {mirror_id} en {target_lang} : {e}")
+
+# Découpe des lignes en messages de moins de 2000 caractères (limite de Discord)
+def split_for_discord(lines, limit=2000):
+    chunks = []
+    current = ""
+    for line in lines:
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+# Taille maximale d'une requête groupée : le traducteur refuse les textes de plus de 5000 caractères
+TRANSLATION_BATCH_MAX_CHARS = int(os.getenv("TRANSLATION_BATCH_MAX_CHARS", "4500"))
+
+# Regroupe des segments en lots d'au plus TRANSLATION_BATCH_MAX_CHARS caractères une
+# fois joints (un segment plus long forme un lot à lui seul)
+def batch_chunks(segments):
+    chunks = []
+    current = []
+    size = 0
+    for segment in segments:
+        if current and size + len(segment) > TRANSLATION_BATCH_MAX_CHARS:
+            chunks.append(current)
+            current = []
+            size = 0
+        current.append(segment)
+        size += len(segment) + 1
+    if current:
+        chunks.append(current)
+    return chunks
+
+# Traduit plusieurs textes vers une langue, avec une requête par langue source et par lot
+async def translate_batch(texts, dest, sources):
+    results = list(texts)
+    by_source = defaultdict(list)
+    for index, source_lang in enumerate(sources):
+        if texts[index]:
+            by_source[source_lang].append(index)
+    for source_lang, indexes in by_source.items():
+        segments = [split_segments(texts[index]) for index in indexes]
+        flat = [segment for item in segments for segment in item]
+        translated = []
+        for chunk in batch_chunks(flat):
+            translated.extend(await translate_segments(chunk, dest, source_lang))
+        position = 0
+        for index, item in zip(indexes, segments):
+            results[index] = "\n".join(translated[position:position + len(item)])
+            position += len(item)
+    return results
+
+# Diffusion à la demande (RELAY_IDLE_AFTER > 0, en secondes) : un salon de relais sans
+# activité humaine (message, frappe, réaction) depuis ce délai ne reçoit plus de copie
+# à chaque message. Les messages sont mis de côté et traduits en une fois, puis publiés
+# dès que quelqu'un se manifeste à nouveau dans le salon (RELAY_IDLE_POLICY=backlog),
+# ou aussi toutes les RELAY_IDLE_DIGEST_INTERVAL secondes (RELAY_IDLE_POLICY=digest).
+RELAY_IDLE_AFTER = float(os.getenv("RELAY_IDLE_AFTER", "0"))
+RELAY_IDLE_POLICY = os.getenv("RELAY_IDLE_POLICY", "backlog")
+RELAY_IDLE_DIGEST_INTERVAL = float(os.getenv("RELAY_IDLE_DIGEST_INTERVAL", "1800"))
+RELAY_BACKLOG_MAX = int(os.getenv("RELAY_BACKLOG_MAX", "50"))
+
+# Mode résumé : les salons de DIGEST_CHANNELS ("general-kr:600,general-cn:900", nom du
+# salon et intervalle en secondes) ne reçoivent qu'un message récapitulatif par
+# intervalle, traduit en une seule fois. Publié plus tôt si DIGEST_MAX_ITEMS est atteint.
+def parse_digest_channels(value):
+    digest_channels = {}
+    for item in value.split(","):
+        if item.strip():
+            name, _, interval = item.strip().partition(":")
+            digest_channels[name] = float(interval or "600")
+    return digest_channels
+
+DIGEST_CHANNELS = parse_digest_channels(os.getenv("DIGEST_CHANNELS", ""))
+DIGEST_MAX_ITEMS = int(os.getenv("DIGEST_MAX_ITEMS", "200"))
+
+started_at = time.monotonic()
+channel_activity = {}
+# id du salon cible -> messages en attente (BacklogItem)
+backlogs = defaultdict(deque)
+# id du salon cible -> futur résolu une fois son rattrapage publié
+backlog_gates = {}
+# id du salon cible -> publication programmée du résumé
+digest_timers = {}
+demand_stats = Counter()
+
+class BacklogItem:
+    __slots__ = ("author", "content", "attachments", "source_lang")
+
+    def __init__(self, message, source_lang):
+        self.author = message.author.name
+        self.content = message.content
+        self.attachments = [attachment.url for attachment in message.attachments]
+        self.source_lang = source_lang
+
+def is_idle(channel):
+    if RELAY_IDLE_AFTER <= 0:
+        return False
+    return time.monotonic() - channel_activity.get(channel.id, started_at) > RELAY_IDLE_AFTER
+
+def defer_to_backlog(target_channel, message, source_lang):
+    backlog = backlogs[target_channel.id]
+    digest_interval = DIGEST_CHANNELS.get(target_channel.name)
+    if digest_interval is None and RELAY_IDLE_POLICY == "digest":
+        digest_interval = RELAY_IDLE_DIGEST_INTERVAL
+    if digest_interval is None and len(backlog) >= RELAY_BACKLOG_MAX:
+        backlog.popleft()
+        demand_stats["backlog_dropped"] += 1
+    backlog.append(BacklogItem(message, source_lang))
+    demand_stats["deferred"] += 1
+    if digest_interval is not None:
+        if len(backlog) >= DIGEST_MAX_ITEMS:
+            start_backlog_flush(target_channel)
+        elif target_channel.id not in digest_timers:
+            digest_timers[target_channel.id] = asyncio.create_task(flush_digest_later(target_channel, digest_interval))
+
+async def flush_digest_later(target_channel, interval):
+    await asyncio.sleep(interval)
+    digest_timers.pop(target_channel.id, None)
+    start_backlog_flush(target_channel)
+
+# Fragment ajouté à un message déjà préparé (rafale, fusion en file) : les salons cibles
+# où ce message a été mis de côté reçoivent aussi le fragment dans leur rattrapage
+def defer_fragment(entry, message):
+    source_lang = detect_language(message.content) or entry.source_lang
+    for channel_id in entry.deferred:
+        target_channel = client.get_channel(channel_id)
+        if target_channel is not None:
+            defer_to_backlog(target_channel, message, source_lang)
+
+def start_backlog_flush(channel):
+    if backlogs.get(channel.id) and channel.id not in backlog_gates:
+        timer = digest_timers.pop(channel.id, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        backlog_gates[channel.id] = asyncio.get_running_loop().create_future()
+        # Le rattrapage passe après les copies déjà réservées vers ce salon, comme une copie de plus
+        track_task(flush_backlog(channel, sequencer.pending(channel.id)))
+
+# Note l'activité d'un humain dans un salon de relais et publie son éventuel rattrapage
+# (sauf pour les salons en mode résumé, publiés à intervalle fixe)
+def record_activity(channel):
+    channel_activity[channel.id] = time.monotonic()
+    if channel.name not in DIGEST_CHANNELS:
+        start_backlog_flush(channel)
+
+async def post_consolidated(target_channel, items, title):
+    target_lang = config_for(target_channel.guild).channels.get(target_channel.name)
+    if target_lang is None:
+        # Salon retiré de la configuration par un rechargement : le rattrapage n'a plus de destination
+        logger.warning(f"Rattrapage de {len(items)} messages abandonné : {target_channel.name} n'est plus un salon de relais")
+        demand_stats["backlog_dropped"] += len(items)
+        return
+    try:
+        translated = await translate_batch([item.content for item in items], target_lang, [item.source_lang for item in items])
+    except Exception as e:
+        # Les messages sont déjà retirés du rattrapage : mieux vaut les publier non traduits que les perdre
+        if not isinstance(e, TranslationThrottled):
+            logger.error(f"Erreur lors de la traduction du rattrapage de {target_channel.name}, publié sans traduction : {e}")
+        translated = [item.content for item in items]
+    lines = [title]
+    for item, text in zip(items, translated):
+        lines.append(f"**{item.author}**: {text or '(Pas de texte)'}")
+        lines.extend(item.attachments)
+    for chunk in split_for_discord(lines):
+        await schedule(PRIORITY_RELAY, ("send", target_channel.id), lambda: target_channel.send(chunk))
+
+async def flush_backlog(target_channel, earlier=()):
+    gate = backlog_gates[target_channel.id]
+    try:
+        for delivered in earlier:
+            await asyncio.shield(delivered)
+        items = list(backlogs.pop(target_channel.id, ()))
+        if items:
+            demand_stats["flushed"] += len(items)
+            logger.info(f"Rattrapage de {len(items)} messages dans {target_channel.name}")
+            if target_channel.name in DIGEST_CHANNELS:
+                title = f"*Résumé de {len(items)} message(s) :*"
+            else:
+                title = f"*{len(items)} message(s) pendant votre absence :*"
+            with usage_scope("backlog", target_channel):
+                await post_consolidated(target_channel, items, title)
+    except Exception as e:
+        logger.error(f"Erreur lors du rattrapage de {target_channel.name} : {e}", exc_info=True)
+    finally:
+        del backlog_gates[target_channel.id]
+        gate.set_result(None)
+
+def demand_metrics():
+    return {
+        "backlog_by_channel": {str(channel_id): len(backlog) for channel_id, backlog in list(backlogs.items()) if backlog},
+        "digest_channels": DIGEST_CHANNELS,
+        "stats": dict(demand_stats),
+    }
+
+# Journal durable des relais (RELAY_JOURNAL, fichier SQLite ; vide pour désactiver).
+# Chaque relais y est écrit avant traitement, puis chaque salon cible est acquitté
+# après l'envoi de sa copie. Au démarrage, les copies non acquittées sont rejouées :
+# un crash au milieu de la diffusion ne fait donc plus perdre de copies.
+# Toutes les opérations passent par un unique thread d'écriture (ordre FIFO), pour ne
+# jamais bloquer la boucle d'événements.
+RELAY_JOURNAL = shard_path(os.getenv("RELAY_JOURNAL", "relay_journal.db"))
+RELAY_JOURNAL_MAX_AGE = float(os.getenv("RELAY_JOURNAL_MAX_AGE", "3600"))
+JOURNAL_COMPACT_EVERY = 200
+
+class RelayJournal:
+    def __init__(self, path):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+        self.connection = None
+        # id du relais -> (date de création, salons cibles restant à acquitter)
+        self.pending = {}
+        self.completed = []
+        self.stats = Counter()
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS relay_jobs (id INTEGER PRIMARY KEY, created_at REAL, payload TEXT, targets TEXT)"
+            )
+            self.connection.execute("CREATE TABLE IF NOT EXISTS relay_acks (job_id INTEGER, channel_id INTEGER)")
+        return self.connection
+
+    def _insert(self, job_id, created_at, payload, target_ids):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO relay_jobs VALUES (?, ?, ?, ?)",
+                (job_id, created_at, payload, json.dumps(target_ids)),
+            )
+
+    def _ack(self, job_id, channel_ids):
+        with self._connect() as connection:
+            connection.executemany("INSERT INTO relay_acks VALUES (?, ?)", [(job_id, channel_id) for channel_id in channel_ids])
+
+    def _compact(self, job_ids):
+        with self._connect() as connection:
+            connection.executemany("DELETE FROM relay_jobs WHERE id = ?", [(job_id,) for job_id in job_ids])
+            connection.executemany("DELETE FROM relay_acks WHERE job_id = ?", [(job_id,) for job_id in job_ids])
+
+    # Relais non terminés : [(id, date de création, contenu, salons cibles non acquittés)]
+    def _load_pending(self):
+        connection = self._connect()
+        acked = defaultdict(set)
+        for job_id, channel_id in connection.execute("SELECT job_id, channel_id FROM relay_acks"):
+            acked[job_id].add(channel_id)
+        pending = []
+        finished = []
+        for job_id, created_at, payload, targets in connection.execute("SELECT id, created_at, payload, targets FROM relay_jobs"):
+            remaining = [channel_id for channel_id in json.loads(targets) if channel_id not in acked[job_id]]
+            if remaining and time.time() - created_at <= RELAY_JOURNAL_MAX_AGE:
+                pending.append((job_id, created_at, json.loads(payload), remaining))
+            else:
+                finished.append(job_id)
+        if finished:
+            self._compact(finished)
+        return pending
+
+    def _close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def _run(self, function, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    # Enregistre un relais ; renvoie le futur de l'écriture
+    def record(self, job):
+        message = job.messages[0]
+        target_ids = [target_channel.id for target_channel, _, _ in job.targets]
+        created_at = time.time()
+        self.pending[message.id] = (created_at, set(target_ids))
+        payload = json.dumps({
+            "channel_id": message.channel.id,
+            "author": message.author.name,
+            "author_id": message.author.id,
+            "display_name": message.author.display_name,
+            "avatar_url": message.author.display_avatar.url,
+            "content": message.content,
+            "attachments": [attachment.url for attachment in message.attachments],
+            "source_lang": job.entry.source_lang,
+        })
+        self.stats["recorded"] += 1
+        return self._run(self._insert, message.id, created_at, payload, target_ids)
+
+    def ack(self, job_id, channel_ids):
+        state = self.pending.get(job_id)
+        if state is None:
+            return
+        state[1].difference_update(channel_ids)
+        self._run(self._ack, job_id, list(channel_ids))
+        if not state[1]:
+            del self.pending[job_id]
+            self.completed.append(job_id)
+            if len(self.completed) >= JOURNAL_COMPACT_EVERY:
+                self._run(self._compact, self.completed)
+                self.completed = []
+
+    async def load_pending(self):
+        pending = await self._run(self._load_pending)
+        for job_id, created_at, _, remaining in pending:
+            self.pending[job_id] = (created_at, set(remaining))
+        return pending
+
+    async def close(self):
+        await self._run(self._close)
+
+    def metrics(self):
+        oldest = min((created_at for created_at, _ in list(self.pending.values())), default=None)
+        return {
+            "pending_jobs": len(self.pending),
+            "backlog_age_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "stats": dict(self.stats),
+        }
+
+relay_journal = RelayJournal(RELAY_JOURNAL) if RELAY_JOURNAL else None
+journal_replayed = False
+usage_flusher = None
+
+# Message reconstruit depuis le journal, avec ce dont le relais a besoin
+class JournaledAttachment:
+    __slots__ = ("url",)
+
+    def __init__(self, url):
+        self.url = url
+
+class JournaledAuthor:
+    __slots__ = ("id", "name", "display_name", "display_avatar", "bot")
+
+    def __init__(self, payload):
+        # Absent des entrées écrites par une version antérieure
+        self.id = payload.get("author_id")
+        self.name = payload["author"]
+        self.display_name = payload["display_name"]
+        self.display_avatar = JournaledAttachment(payload["avatar_url"])
+        self.bot = False
+
+class JournaledMessage:
+    __slots__ = ("id", "channel", "guild", "author", "content", "attachments")
+
+    def __init__(self, job_id, channel, payload):
+        self.id = job_id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = JournaledAuthor(payload)
+        self.content = payload["content"]
+        self.attachments = [JournaledAttachment(url) for url in payload["attachments"]]
+
+# Rejoue au démarrage les copies que le processus précédent n'a pas pu envoyer
+async def replay_journal():
+    pending = await relay_journal.load_pending()
+    if not pending:
+        return
+    logger.info(f"Reprise de {len(pending)} relais interrompus")
+    for job_id, _, payload, remaining in sorted(pending, key=lambda item: item[1]):
+        channel = client.get_channel(payload["channel_id"])
+        if channel is None:
+            # Salon invisible pour ce processus : l'entrée reste dans le journal, jusqu'à
+            # RELAY_JOURNAL_MAX_AGE, plutôt que d'être acquittée sans avoir été relayée
+            relay_journal.pending.pop(job_id, None)
+            relay_journal.stats["skipped"] += 1
+            continue
+        message = JournaledMessage(job_id, channel, payload)
+        job = prepare_relay(message, only=set(remaining), source_lang=payload["source_lang"])
+        # Salons disparus depuis : rien à rejouer
+        relay_journal.ack(job_id, set(remaining) - {target_channel.id for target_channel, _, _ in job.targets})
+        relay_journal.stats["replayed"] += 1
+        relay_queue.enqueue(job, channel.guild.id)
+
+class RelayJob:
+    __slots__ = ("messages", "seq", "entry", "targets", "enqueued_at", "translate", "done", "persisted", "trace")
+
+    def __init__(self, message, seq, entry, targets):
+        self.messages = [message]
+        self.seq = seq
+        self.entry = entry
+        # [(salon cible, langue cible, place réservée)]
+        self.targets = targets
+        self.enqueued_at = time.monotonic()
+        self.translate = True
+        self.done = asyncio.get_running_loop().create_future()
+        # Écriture dans le journal, attendue avant le premier envoi
+        self.persisted = None
+        # Span racine de la trace du relais (None si le traçage est désactivé)
+        self.trace = None
+
+    @property
+    def message(self):
+        return self.messages[0] if len(self.messages) == 1 else CoalescedMessage(self.messages)
+
+# Prépare le relais d'un message : numéro de séquence, langue source et places
+# réservées dans chaque salon cible. Entièrement synchrone, pour garder l'ordre de réception.
+# `only` restreint les salons cibles (reprise depuis le journal, déjà enregistrée)
+def prepare_relay(message, only=None, source_lang=None):
+    trace = relay_tracing.start_span("relay", message.id, channel=message.channel.name, replay=only is not None)
+    started = time.perf_counter()
+    seq = next(relay_sequences[message.channel.id])
+    channel_lang, route = config_for(message.guild).route(message.channel)
+    # La langue du salon sert par défaut, sauf si le message est clairement écrit dans une autre
+    source_lang = source_lang or detect_language(message.content) or channel_lang
+    entry = MirrorEntry(source_lang, split_segments(message.content))
+    remember_mirrors(message.id, entry)
+    targets = []
+    for target_channel, target_lang in route:
+        if only is not None and target_channel.id not in only:
+            continue
+        if target_channel.name in DIGEST_CHANNELS or is_idle(target_channel):
+            defer_to_backlog(target_channel, message, source_lang)
+            entry.deferred.append(target_channel.id)
+        else:
+            slot = sequencer.reserve(message.channel.id, target_channel.id, seq)
+            slot.gate = backlog_gates.get(target_channel.id)
+            targets.append((target_channel, target_lang, slot))
+    relay_tracing.record_span("prepare", time.perf_counter() - started, trace, source_lang=source_lang, targets=len(targets))
+    job = RelayJob(message, seq, entry, targets)
+    job.trace = trace
+    if relay_journal and only is None and targets:
+        job.persisted = relay_journal.record(job)
+    return job
+
+async def relay_and_ack(job, message, target_channel, target_lang, slot):
+    with relay_tracing.span("target", parent=job.trace, channel=target_channel.name, lang=target_lang), usage_scope("relay", message.channel, message.author):
+        await relay_to_target(message, job.entry, target_channel, target_lang, slot, job.translate)
+    # Source supprimée pendant l'envoi : delete_mirrors ne voyait pas encore cette copie
+    if job.entry.deleted and target_channel.id in job.entry.mirrors:
+        mirror_id, _, _, via_webhook = job.entry.mirrors.pop(target_channel.id)
+        await delete_individually(target_channel, [(mirror_id, via_webhook)])
+    if relay_journal:
+        relay_journal.ack(job.messages[0].id, [target_channel.id])
+
+# Abandonne un relais (délestage) : places libérées dans l'ordre, rien à rejouer
+def abandon_job(job):
+    for _, _, slot in job.targets:
+        track_task(slot.abandon())
+    if relay_journal:
+        relay_journal.ack(job.messages[0].id, [target_channel.id for target_channel, _, _ in job.targets])
+    if job.trace:
+        job.trace.end("shed")
+    if not job.done.done():
+        job.done.set_result(None)
+
+async def run_relay(job):
+    try:
+        if job.persisted is not None:
+            try:
+                await job.persisted
+            except Exception as e:
+                logger.error(f"Impossible d'écrire le relais {job.messages[0].id} dans le journal : {e}")
+        # Messages fusionnés (délestage "merge") modifiés ou supprimés pendant l'attente
+        if len(job.messages) > 1 and job.entry.group is not None and job.entry.group.fragments:
+            job.messages = list(job.entry.group.fragments)
+        message = job.message
+        job.entry.segments = split_segments(message.content)
+        # Budget de traduction du salon épuisé : copies non traduites jusqu'à la fenêtre suivante
+        if job.translate and translation_usage.over_budget(message.channel):
+            job.translate = False
+            translation_usage.degraded[message.channel.name] += 1
+        if job.trace:
+            job.trace.set(fragments=len(job.messages), translate=job.translate)
+        await asyncio.gather(*(
+            relay_and_ack(job, message, target_channel, target_lang, slot)
+            for target_channel, target_lang, slot in job.targets
+        ))
+    finally:
+        if job.trace:
+            job.trace.end()
+        if not job.done.done():
+            job.done.set_result(None)
+
+async def update_mirror(message, entry, channel_id, segments, source_lang):
+    mirror = entry.mirrors.get(channel_id)
+    target_channel = client.get_channel(channel_id)
+    # Copie supprimée entre-temps (delete_mirrors) ou salon disparu
+    if mirror is None or target_channel is None:
+        return
+    mirror_id, target_lang, old_translated, via_webhook = mirror
+    # Sans traduction connue (copie non traduite), tout est retraduit
+    known = dict(zip(entry.segments, old_translated)) if old_translated is not None and source_lang == entry.source_lang else None
+    try:
+        try:
+            translated = await translate_segments(segments, target_lang, source_lang, known)
+        except TranslationThrottled as e:
+            # Quota épuisé : "digest" garde l'ancienne traduction (une modification n'a pas
+            # de rattrapage), "untranslated" montre le nouveau texte non traduit
+            if TRANSLATION_THROTTLED_POLICY == "digest":
+                logger.warning(f"Copie {mirror_id} en {target_lang} laissée telle quelle, modification non traduite : {e}")
+                return
+            await edit_mirror(target_channel, mirror_id, via_webhook, message, "\n".join(segments))
+            entry.mirrors[channel_id] = (mirror_id, target_lang, None, via_webhook)
+            return
+        await edit_mirror(target_channel, mirror_id, via_webhook, message, "\n".join(translated))
+        entry.mirrors[channel_id] = (mirror_id, target_lang, translated, via_webhook)
+    except Exception as e:
+        logger.error(f"Erreur lors de la mise à jour de la copie {mirror_id} en {target_lang} : {e}")
+
+# Modifie les copies d'un message édité en ne retraduisant que les lignes modifiées
+async def update_mirrors(message, entry):
+    segments = split_segments(message.content)
+    source_lang = detect_language(message.content) or config_for(message.guild).route(message.channel)[0]
+    with usage_scope("edit", message.channel, message.author):
+        await asyncio.gather(*(update_mirror(message, entry, channel_id, segments, source_lang) for channel_id in list(entry.mirrors)))
+    entry.segments = segments
+    entry.source_lang = source_lang
+
+# Regroupement des rafales (COALESCE_WINDOW > 0, en secondes) : les messages envoyés
+# coup sur coup par le même auteur dans un salon de relais sont fusionnés dans une
+# seule copie par salon cible, modifiée en place à l'arrivée de chaque fragment
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", "0"))
+COALESCE_EDIT_DELAY = float(os.getenv("COALESCE_EDIT_DELAY", "1"))
+COALESCE_MAX_LENGTH = int(os.getenv("COALESCE_MAX_LENGTH", "1500"))
+# id du salon source -> rafale du dernier message reçu dans ce salon
+burst_groups = {}
+
+# Vue d'une rafale comme un seul message, pour format_mirror et send_mirror
+class CoalescedMessage:
+    __slots__ = ("id", "channel", "guild", "author", "content", "attachments")
+
+    def __init__(self, fragments):
+        first = fragments[0]
+        self.id = first.id
+        self.channel = first.channel
+        self.guild = first.guild
+        self.author = first.author
+        self.content = "\n".join(fragment.content for fragment in fragments if fragment.content)
+        self.attachments = [attachment for fragment in fragments for attachment in fragment.attachments]
+
+class BurstGroup:
+    __slots__ = ("fragments", "author_id", "last_at", "length", "relayed", "update_task", "lock")
+
+    def __init__(self, message):
+        loop = asyncio.get_running_loop()
+        self.fragments = [message]
+        self.author_id = message.author.id
+        self.last_at = loop.time()
+        self.length = len(message.content)
+        # Futur résolu une fois les copies du premier message envoyées (RelayJob.done)
+        self.relayed = None
+        self.update_task = None
+        self.lock = asyncio.Lock()
+
+    def accepts(self, message, now):
+        return (
+            message.author.id == self.author_id
+            and now - self.last_at <= COALESCE_WINDOW
+            and self.length + len(message.content) <= COALESCE_MAX_LENGTH
+        )
+
+# Rattache le message à la rafale en cours du salon, ou en ouvre une nouvelle.
+# Un message d'un autre auteur clôt la rafale précédente.
+def track_burst(message):
+    now = asyncio.get_running_loop().time()
+    group = burst_groups.get(message.channel.id)
+    entry = mirror_map.get(group.fragments[0].id) if group else None
+    if group and entry and group.accepts(message, now):
+        group.fragments.append(message)
+        group.last_at = now
+        group.length += len(message.content) + 1
+        entry.group = group
+        remember_mirrors(message.id, entry)
+        defer_fragment(entry, message)
+        if group.update_task is None:
+            group.update_task = asyncio.create_task(flush_burst(group))
+        return group
+    group = burst_groups[message.channel.id] = BurstGroup(message)
+    return group
+
+# Répercute les fragments reçus sur les copies, en une seule modification par salon cible
+async def flush_burst(group):
+    await asyncio.sleep(COALESCE_EDIT_DELAY)
+    if group.relayed:
+        await group.relayed
+    group.update_task = None
+    await refresh_burst(group)
+
+async def refresh_burst(group):
+    async with group.lock:
+        entry = mirror_map.get(group.fragments[0].id) if group.fragments else None
+        if entry:
+            await update_mirrors(CoalescedMessage(group.fragments), entry)
+
+# Files de relais bornées, par serveur et au global. Quand elles débordent, la
+# politique RELAY_SHED_POLICY s'applique :
+#   drop_oldest  : abandonne le plus ancien message en attente
+#   merge        : fusionne le message dans celui du même salon et du même auteur déjà
+#                  en attente (à défaut, abandonne le plus ancien)
+#   untranslated : relaie tout de suite, sans traduction, le plus ancien message en
+#                  attente (voie express, bornée à RELAY_QUEUE_GLOBAL_MAX messages)
+#   pause        : suspend les salons de RELAY_LOW_PRIORITY_CHANNELS
+# Les messages qui ont attendu plus de RELAY_MAX_AGE secondes sont relayés sans
+# traduction (politique untranslated) ou abandonnés, pour borner la latence.
+RELAY_WORKERS = int(os.getenv("RELAY_WORKERS", "4"))
+RELAY_QUEUE_GUILD_MAX = int(os.getenv("RELAY_QUEUE_GUILD_MAX", "50"))
+RELAY_QUEUE_GLOBAL_MAX = int(os.getenv("RELAY_QUEUE_GLOBAL_MAX", "200"))
+RELAY_SHED_POLICY = os.getenv("RELAY_SHED_POLICY", "drop_oldest")
+RELAY_LOW_PRIORITY_CHANNELS = {name.strip() for name in os.getenv("RELAY_LOW_PRIORITY_CHANNELS", "").split(",") if name.strip()}
+RELAY_PAUSE_RATIO = float(os.getenv("RELAY_PAUSE_RATIO", "0.5"))
+RELAY_MAX_AGE = float(os.getenv("RELAY_MAX_AGE", "60"))
+SHED_LOG_INTERVAL = 10
+
+class RelayQueue:
+    def __init__(self):
+        self.guilds = defaultdict(deque)
+        self.rotation = deque()
+        self.total = 0
+        # Relais délestés sans traduction (politique untranslated), servis en premier
+        self.express = deque()
+        self.workers = []
+        self.has_work = None
+        self.stats = Counter()
+        self.max_wait = 0.0
+        self.last_shed_log = 0.0
+        self.running = 0
+
+    def start(self):
+        self.has_work = asyncio.Event()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(RELAY_WORKERS)]
+
+    def paused(self, message):
+        return (
+            RELAY_SHED_POLICY == "pause"
+            and message.channel.name in RELAY_LOW_PRIORITY_CHANNELS
+            and self.total >= RELAY_QUEUE_GLOBAL_MAX * RELAY_PAUSE_RATIO
+        )
+
+    def _shed(self, reason, message):
+        self.stats[reason] += 1
+        now = time.monotonic()
+        if now - self.last_shed_log >= SHED_LOG_INTERVAL:
+            self.last_shed_log = now
+            logger.warning(
+                f"File de relais saturée ({self.total} en attente), politique {RELAY_SHED_POLICY} : "
+                f"{reason} (message {message.id} de {message.channel.name}) ; cumul {dict(self.stats)}"
+            )
+
+    # Met le message en file et renvoie la tâche qui le relaiera (None s'il est abandonné)
+    def submit(self, message):
+        if not self.workers:
+            self.start()
+        if self.paused(message):
+            self._shed("paused", message)
+            return None
+        queue = self.guilds.get(message.guild.id, ())
+        if len(queue) >= RELAY_QUEUE_GUILD_MAX or self.total >= RELAY_QUEUE_GLOBAL_MAX:
+            if RELAY_SHED_POLICY == "merge":
+                # Seulement avec un message du même auteur, sinon la copie porterait un autre nom
+                job = next((
+                    job for job in reversed(queue)
+                    if job.messages[0].channel.id == message.channel.id and job.messages[0].author == message.author
+                ), None)
+                if job:
+                    # Suivi comme une rafale : modifier ou supprimer un des messages ne touche que son texte
+                    if job.entry.group is None:
+                        job.entry.group = BurstGroup(job.messages[0])
+                        job.entry.group.relayed = job.done
+                    job.entry.group.fragments.append(message)
+                    job.messages.append(message)
+                    remember_mirrors(message.id, job.entry)
+                    defer_fragment(job.entry, message)
+                    self._shed("merged", message)
+                    return job
+            elif RELAY_SHED_POLICY == "untranslated" and len(self.express) < RELAY_QUEUE_GLOBAL_MAX:
+                # Le plus ancien ne dépend d'aucun message encore en file : sans traduction,
+                # il part dès qu'un worker se libère
+                job = self._oldest(queue)
+                self._remove(job)
+                job.translate = False
+                self.express.append(job)
+                self._shed("untranslated", job.messages[0])
+                return self.enqueue(prepare_relay(message), message.guild.id)
+            elif RELAY_SHED_POLICY == "pause" and message.channel.name in RELAY_LOW_PRIORITY_CHANNELS:
+                self._shed("paused", message)
+                return None
+            self.drop(self._oldest(queue))
+        return self.enqueue(prepare_relay(message), message.guild.id)
+
+    def enqueue(self, job, guild_id):
+        if not self.workers:
+            self.start()
+        queue = self.guilds[guild_id]
+        if not queue:
+            self.rotation.append(guild_id)
+        queue.append(job)
+        self.total += 1
+        self.has_work.set()
+        return job
+
+    # Victime en cas de débordement : en priorité un salon de faible priorité, puis le plus ancien
+    def _oldest(self, queue):
+        if len(queue) < RELAY_QUEUE_GUILD_MAX:
+            queue = max(self.guilds.values(), key=len)
+        for job in queue:
+            if job.messages[0].channel.name in RELAY_LOW_PRIORITY_CHANNELS:
+                return job
+        return queue[0]
+
+    def _remove(self, job):
+        guild_id = job.messages[0].guild.id
+        queue = self.guilds[guild_id]
+        queue.remove(job)
+        self.total -= 1
+        # File vidée : le serveur quitte le tourniquet, enqueue l'y remettra
+        if not queue:
+            del self.guilds[guild_id]
+            self.rotation.remove(guild_id)
+
+    def drop(self, job):
+        message = job.messages[0]
+        self._remove(job)
+        self._shed("dropped", message)
+        for fragment in job.messages:
+            mirror_map.pop(fragment.id, None)
+        abandon_job(job)
+
+    def _next_job(self):
+        if self.express:
+            return self.express.popleft()
+        # Tourniquet entre serveurs pour qu'un serveur très actif n'affame pas les autres ;
+        # un serveur dont la file est vide est retiré au passage
+        while True:
+            guild_id = self.rotation.popleft()
+            queue = self.guilds.get(guild_id)
+            if queue:
+                break
+            self.guilds.pop(guild_id, None)
+        job = queue.popleft()
+        self.total -= 1
+        if queue:
+            self.rotation.append(guild_id)
+        else:
+            del self.guilds[guild_id]
+        return job
+
+    async def _worker(self):
+        relay_tracing.current_span.set(None)
+        while True:
+            while not self.total and not self.express:
+                self.has_work.clear()
+                await self.has_work.wait()
+            job = self._next_job()
+            waited = time.monotonic() - job.enqueued_at
+            self.max_wait = max(self.max_wait, waited)
+            relay_tracing.record_span("queue_wait", waited, job.trace)
+            if waited > RELAY_MAX_AGE:
+                if RELAY_SHED_POLICY != "untranslated":
+                    # Déjà retiré de la file : on libère ses places sans passer par drop()
+                    self._shed("expired", job.messages[0])
+                    abandon_job(job)
+                    continue
+                self._shed("untranslated", job.messages[0])
+                job.translate = False
+            self.running += 1
+            try:
+                await run_relay(job)
+            except Exception as e:
+                logger.error(f"Erreur lors du relais du message {job.messages[0].id} : {e}", exc_info=True)
+            finally:
+                self.running -= 1
+
+    def idle(self):
+        return not self.total and not self.express and not self.running
+
+    def metrics(self):
+        return {
+            "queued": self.total,
+            "express": len(self.express),
+            "queued_by_guild": {str(guild_id): len(queue) for guild_id, queue in list(self.guilds.items())},
+            "max_wait_seconds": round(self.max_wait, 3),
+            "shed": dict(self.stats),
+            "policy": RELAY_SHED_POLICY,
+        }
+
+relay_queue = RelayQueue()
+
+# La suppression groupée refuse les messages de plus de 14 jours (marge d'une heure)
+BULK_DELETE_MAX_AGE = 14 * 86400 - 3600
+
+# Supprime des copies une par une, chacune par son expéditeur (le bot ou le webhook)
+async def delete_individually(target_channel, mirrors):
+    for mirror_id, via_webhook in mirrors:
+        try:
+            webhook = await get_webhook(target_channel) if via_webhook else None
+            if webhook is not None:
+                await schedule(PRIORITY_CLEANUP, ("webhook", webhook.id), lambda: webhook.delete_message(mirror_id))
+            else:
+                # Copie du bot, ou webhook indisponible : la permission "Gérer les messages" suffit
+                mirror = target_channel.get_partial_message(mirror_id)
+                await schedule(PRIORITY_CLEANUP, ("delete", target_channel.id), mirror.delete)
+        except discord.HTTPException as e:
+            logger.error(f"Erreur lors de la suppression de la copie {mirror_id} : {e}")
+
+# Supprime les copies de plusieurs messages source, regroupées par salon cible
+async def delete_mirrors(source_ids):
+    by_channel = defaultdict(list)
+    for source_id in source_ids:
+        entry = mirror_map.pop(source_id, None)
+        if entry and entry.group and len(entry.group.fragments) > 1:
+            # Fragment d'une rafale : on retire seulement son texte des copies
+            entry.group.fragments = [fragment for fragment in entry.group.fragments if fragment.id != source_id]
+            track_task(refresh_burst(entry.group))
+            continue
+        if entry:
+            # Les relais encore en file ou en cours voient la suppression (relay_to_target)
+            entry.deleted = True
+            for channel_id, (mirror_id, _, _, via_webhook) in entry.mirrors.items():
+                by_channel[channel_id].append((mirror_id, via_webhook))
+            entry.mirrors.clear()
+    now = discord.utils.utcnow()
+    for channel_id, mirrors in by_channel.items():
+        target_channel = client.get_channel(channel_id)
+        if target_channel is None:
+            continue
+        recent = [
+            mirror for mirror in mirrors
+            if (now - discord.utils.snowflake_time(mirror[0])).total_seconds() < BULK_DELETE_MAX_AGE
+        ]
+        if len(recent) < len(mirrors):
+            await delete_individually(target_channel, [mirror for mirror in mirrors if mirror not in recent])
+        for i in range(0, len(recent), 100):
+            chunk = recent[i:i + 100]
+            try:
+                targets = [discord.Object(id=mirror_id) for mirror_id, _ in chunk]
+                await schedule(PRIORITY_CLEANUP, ("delete", channel_id), lambda: target_channel.delete_messages(targets))
+            except discord.Forbidden:
+                # La suppression groupée demande la permission "Gérer les messages"
+                await delete_individually(target_channel, chunk)
+            except discord.HTTPException as e:
+                logger.error(f"Erreur lors de la suppression des copies dans {target_channel.name} : {e}")
+
+@client.event
+async def on_ready():
+    global journal_replayed, config_watcher, usage_flusher
+    logger.info(f"Connecté en tant que {client.user}")
+    connection_stats["identifies"] += 1
+    if "ready" not in startup_timings:
+        mark_startup("ready")
+    if config_watcher is None and CONFIG_RELOAD_INTERVAL > 0:
+        config_watcher = asyncio.create_task(watch_guild_configs())
+    if usage_flusher is None and USAGE_FLUSH_INTERVAL > 0:
+        usage_flusher = asyncio.create_task(flush_usage_periodically())
+    # on_ready est aussi appelé après une reconnexion : la reprise ne se fait qu'une fois
+    if relay_journal and not journal_replayed:
+        journal_replayed = True
+        await replay_journal()
+
+@client.event
+async def on_message(message):
+    if message.author == client.user or shutdown_event.is_set():
+        return
+    # Copies envoyées par nos propres webhooks
+    if message.webhook_id in webhook_ids:
+        return
+
+    if message.content.startswith("!langue") and not message.author.bot:
+        if await handle_language_command(message):
+            return
+    # Messages privés : seule la commande !langue y est prise en charge
+    if message.guild is None:
+        return
+    config = config_for(message.guild)
+
+    # Gestion des salons de traduction
+    if message.channel.name in config.channels:
+        if not message.author.bot:
+            record_activity(message.channel)
+        group = track_burst(message) if COALESCE_WINDOW > 0 else None
+        if group and group.fragments[0] is not message:
+            return  # Fusionné dans la copie du message précédent
+        job = relay_queue.submit(message)
+        if group and job:
+            group.relayed = job.done
+
+    # Gestion du salon event-test
+    elif message.channel.name == config.event_channel and not message.author.bot:
+        if message.content and user_preferences.get(message.guild.id):
+            track_task(deliver_to_preferences(message))
+        try:
+            # Les réactions sont cadencées par l'ordonnanceur selon la limite de la route
+            for flag in flags_to_seed(message):
+                await schedule(PRIORITY_REPLY, ("react", message.channel.id), lambda: message.add_reaction(flag))
+        except discord.HTTPException as e:
+            logger.error(f"Rate limit ou erreur lors de l'ajout de la réaction {flag} : {e}", exc_info=True)
+        except Exception as e:
+            logger.error(f"Erreur générale dans event-test : {e}", exc_info=True)
+
+# La frappe et les réactions comptent comme de l'activité dans les salons de relais
+@client.event
+async def on_typing(channel, user, when):
+    if getattr(channel, "guild", None) and channel.name in config_for(channel.guild).channels and not user.bot:
+        record_activity(channel)
+
+@client.event
+async def on_raw_reaction_add(payload):
+    channel = client.get_channel(payload.channel_id)
+    if channel is not None and payload.guild_id and channel.name in config_for(channel.guild).channels and payload.user_id != client.user.id:
+        record_activity(channel)
+
+@client.event
+async def on_guild_channel_create(channel):
+    invalidate_routes(channel.guild)
+
+@client.event
+async def on_guild_channel_delete(channel):
+    invalidate_routes(channel.guild)
+
+@client.event
+async def on_guild_channel_update(before, after):
+    if before.name != after.name:
+        invalidate_routes(after.guild)
+
+# Propagation des modifications et des suppressions
+
+# Message modifié, reconstruit depuis l'événement brut : discord.py ne signale les
+# modifications (on_message_edit) que pour les messages encore dans son cache, bien plus
+# petit que mirror_map
+class EditedMessage:
+    __slots__ = ("id", "channel", "guild", "author", "content", "attachments")
+
+    def __init__(self, channel, payload):
+        cached = payload.cached_message
+        self.id = payload.message_id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = cached.author if cached else client._connection.store_user(payload.data["author"])
+        self.content = payload.data["content"]
+        if "attachments" in payload.data:
+            self.attachments = [JournaledAttachment(attachment["url"]) for attachment in payload.data["attachments"]]
+        else:
+            self.attachments = cached.attachments if cached else []
+
+@client.event
+async def on_raw_message_edit(payload):
+    entry = mirror_map.get(payload.message_id)
+    # Sans "content", la modification ne touche pas au texte (aperçus de liens, épinglage...)
+    if entry is None or shutdown_event.is_set() or "content" not in payload.data:
+        return
+    channel = client.get_channel(payload.channel_id)
+    if channel is None or (payload.cached_message is None and "author" not in payload.data):
+        return
+    after = EditedMessage(channel, payload)
+    if entry.group:
+        entry.group.fragments = [after if fragment.id == after.id else fragment for fragment in entry.group.fragments]
+        after = CoalescedMessage(entry.group.fragments)
+    # Les aperçus de liens déclenchent aussi une modification : on ignore si le texte n'a pas changé
+    if split_segments(after.content) == entry.segments:
+        return
+    await update_mirrors(after, entry)
+
+@client.event
+async def on_raw_message_delete(payload):
+    await delete_mirrors([payload.message_id])
+
+@client.event
+async def on_raw_bulk_message_delete(payload):
+    await delete_mirrors(payload.message_ids)
+
+@client.event
+async def on_reaction_add(reaction, user):
+    if shutdown_event.is_set():
+        return
+    config = config_for(reaction.message.guild)
+    if user == client.user or reaction.message.channel.name != config.event_channel or reaction.message.author == client.user:
+        return
+
+    emoji = str(reaction.emoji)
+    target_lang = config.lang_map.get(emoji)
+    
+    if target_lang:
+        flag_clicks[reaction.message.channel.id][emoji] += 1
+        record_click(reaction.message.guild, user, target_lang)
+        # Un autre clic sur ce drapeau est déjà en cours de traitement : on se greffe dessus
+        key = (reaction.message.id, target_lang)
+        entry = pending_replies.get(key)
+        if entry:
+            logger.info("Réaction %s par %s regroupée avec la réponse existante", emoji, user.name, extra={"event": "reaction_grouped"})
+            entry.add(user)
+            return
+        entry = pending_replies[key] = PendingReply(user)
+        with relay_tracing.span("reaction", reaction.message.id, emoji=emoji, lang=target_lang) as reaction_span, usage_scope("reaction", reaction.message.channel, user):
+            try:
+                with relay_tracing.span("fetch_message"):
+                    message = await reaction.message.channel.fetch_message(reaction.message.id)
+                if message.content:
+                    source_lang = detect_language(message.content)
+                    if source_lang == target_lang:
+                        logger.info("Message %s déjà en %s, réaction %s ignorée", message.id, target_lang, emoji, extra={"event": "reaction_ignored"})
+                        pending_replies.pop(key, None)
+                        return
+                    logger.info(
+                        "Réaction détectée : %s par %s, traduction en %s : %s", emoji, user.name, target_lang, loggable(message.content),
+                        extra={"event": "reaction_translated"},
+                    )
+                    entry.translated = await translate_text(message.content, target_lang, src=source_lang)
+                    channel = reaction.message.channel
+                    entry.reply = await schedule(PRIORITY_REPLY, ("send", channel.id), lambda: channel.send(entry.content()))
+                    # Des clics arrivés pendant l'envoi ne figurent pas encore dans la réponse
+                    if len(entry.mentions) > 1:
+                        entry.edit_task = asyncio.create_task(entry.edit_later())
+                    track_cleanup(expire_reply(key, entry))
+                else:
+                    pending_replies.pop(key, None)
+                    logger.info("Message sans contenu texte : %s", message.id, extra={"event": "reaction_ignored"})
+            except Exception as e:
+                pending_replies.pop(key, None)
+                if reaction_span:
+                    reaction_span.status = "error"
+                # Tous les clics regroupés dans cette réponse attendaient la traduction
+                mentions = " ".join(entry.mentions)
+                if isinstance(e, TranslationThrottled):
+                    logger.warning(f"Réaction {emoji} non traduite : {e}")
+                    notice = f"{mentions}, quota de traduction atteint, réessaie dans un instant."
+                else:
+                    logger.error(f"Erreur lors de la traduction pour la réaction {emoji} : {e}", exc_info=True)
+                    notice = f"{mentions}, erreur lors de la traduction."
+                channel = reaction.message.channel
+                error_msg = await schedule(PRIORITY_REPLY, ("send", channel.id), lambda: channel.send(notice))
+                track_cleanup(delete_later(error_msg, 10))
+
+# Routes ajoutées une fois le bot initialisé (le serveur tourne peut-être déjà)
+@app.route('/metrics')
+def metrics():
+    return jsonify({
+        "scheduler": scheduler.metrics(),
+        "relay": relay_queue.metrics(),
+        "demand": demand_metrics(),
+        "journal": relay_journal.metrics() if relay_journal else None,
+        "shards": {str(shard_id): round(latency, 3) for shard_id, latency in getattr(client, "latencies", []) if math.isfinite(latency)},
+        "connection": connection_metrics(),
+        "startup": dict(startup_timings),
+        "logging": relay_logging.logging_metrics(),
+        "guild_configs": len(guild_configs),
+        "translation": {
+            "executor": "process" if TRANSLATION_PROCESSES > 0 else "thread",
+            "workers": TRANSLATION_PROCESSES or TRANSLATION_WORKERS,
+            "in_flight": len(translations_in_flight),
+            "cached": len(translation_cache),
+            "governor": translation_governor.metrics(),
+        },
+    })
+
+# Supervision de la connexion : une seule boucle asyncio et un seul client pour toute
+# la vie du processus, si bien que les caches, files et tâches en mémoire survivent
+# aux coupures. discord.py reprend lui-même la session (RESUME) après une coupure
+# ordinaire du gateway ; le superviseur ne relance la connexion que si elle abandonne,
+# après un délai exponentiel tiré au hasard entre 0 et le plafond (full jitter).
+RECONNECT_BASE_DELAY = float(os.getenv("RECONNECT_BASE_DELAY", "1"))
+RECONNECT_MAX_DELAY = float(os.getenv("RECONNECT_MAX_DELAY", "300"))
+# Connexion restée stable assez longtemps : le délai repart du minimum
+RECONNECT_RESET_AFTER = float(os.getenv("RECONNECT_RESET_AFTER", "60"))
+connection_stats = Counter()
+connection_state = {"connected_since": None, "last_error": None, "next_retry_at": None}
+
+@client.event
+async def on_connect():
+    connection_stats["connects"] += 1
+    connection_state["connected_since"] = time.time()
+
+@client.event
+async def on_disconnect():
+    connection_stats["disconnects"] += 1
+    connection_state["connected_since"] = None
+
+@client.event
+async def on_resumed():
+    connection_stats["resumes"] += 1
+
+async def supervise(token):
+    loop = asyncio.get_running_loop()
+    # SIGTERM (arrêt de la plateforme) et Ctrl+C déclenchent l'arrêt propre
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, request_shutdown)
+    # Le Translator (et l'import de googletrans) se prépare en arrière-plan pendant la connexion
+    loop.run_in_executor(translation_executor, translation_worker.warm_up)
+    attempt = 0
+    logged_in = False
+    async with client:
+        while not client.is_closed():
+            started = time.monotonic()
+            try:
+                if not logged_in:
+                    await client.login(token)
+                    logged_in = True
+                await client.connect(reconnect=True)
+            except (discord.LoginFailure, discord.PrivilegedIntentsRequired) as e:
+                # Jeton refusé ou intents non autorisés : réessayer n'y changera rien
+                logger.critical(f"Connexion impossible, le bot s'arrête : {e}")
+                return
+            except Exception as e:
+                connection_stats["failures"] += 1
+                connection_state["last_error"] = f"{type(e).__name__}: {e}"
+                logger.error(f"Le bot s'est arrêté avec une erreur : {e}", exc_info=True)
+            if client.is_closed() or shutdown_event.is_set():
+                break
+            if time.monotonic() - started > RECONNECT_RESET_AFTER:
+                attempt = 0
+            delay = random.uniform(0, min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** attempt))
+            attempt += 1
+            connection_stats["restarts"] += 1
+            connection_state["next_retry_at"] = time.time() + delay
+            logger.info(f"Tentative de reconnexion dans {delay:.1f} secondes...")
+            await sleep_until_shutdown(delay)
+            connection_state["next_retry_at"] = None
+        # connect() rend la main dès que shutdown() ferme le gateway : on attend la fin de
+        # l'arrêt (journal, pool de traduction), sans quoi asyncio.run l'annulerait
+        if shutdown_task is not None:
+            await shutdown_task
+
+def connection_metrics():
+    connected_since = connection_state["connected_since"]
+    next_retry_at = connection_state["next_retry_at"]
+    return {
+        **connection_stats,
+        "connected_seconds": round(time.time() - connected_since) if connected_since else None,
+        "next_retry_in": round(max(0.0, next_retry_at - time.time()), 1) if next_retry_at else None,
+        "last_error": connection_state["last_error"],
+    }
+
+# Traces récentes (relay_tracing.py) : ?trace_id=<id du message>, ?min_ms=<durée minimale>, ?limit=<nombre>
+@app.route('/traces')
+def traces():
+    return jsonify(relay_tracing.get_traces(
+        request.args.get("trace_id"),
+        limit=int(request.args.get("limit", "20")),
+        min_ms=float(request.args.get("min_ms", "0")),
+    ))
+
+# Volume de traduction par chemin, salon et langue, et budgets des salons
+@app.route('/usage')
+def usage():
+    return jsonify(translation_usage.metrics())
+
+# Fonction pour lancer le bot Discord avec reconnexion
+def run_bot():
+    token = os.getenv("DISCORD_TOKEN")
+    if not token:
+        logger.critical("DISCORD_TOKEN n'est pas défini, le bot ne démarre pas")
+        return
+    logger.info("Démarrage du bot Discord...")
+    asyncio.run(supervise(token))
+
+# Travail encore en cours : relais, envois, suppressions différées, rafales, rattrapages
+# et autres tâches de fond (hors la tâche d'arrêt elle-même)
+def work_pending():
+    return (
+        not relay_queue.idle()
+        or not scheduler.idle()
+        or cleanup_tasks
+        or backlog_gates
+        or any(task is not asyncio.current_task() for task in background_tasks)
+        or any(group.update_task for group in burst_groups.values())
+    )
+
+# Arrêt coordonné : on cesse d'accepter des événements, on termine les relais en cours
+# et les suppressions différées dans la limite de SHUTDOWN_TIMEOUT secondes, on sauvegarde
+# ce qui doit l'être puis on ferme le gateway. Les relais inachevés restent dans le
+# journal et seront rejoués au prochain démarrage.
+shutdown_task = None
+
+# Lance l'arrêt une seule fois et garde sa tâche, attendue par supervise
+def request_shutdown():
+    global shutdown_task
+    if shutdown_task is None:
+        shutdown_task = track_task(shutdown())
+
+async def shutdown():
+    if shutdown_event.is_set():
+        return
+    shutdown_event.set()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SHUTDOWN_TIMEOUT
+    logger.info(f"Arrêt demandé, fin des tâches en cours (au plus {SHUTDOWN_TIMEOUT:.0f} secondes)...")
+    # Les rattrapages et résumés en attente sont publiés tout de suite
+    for channel_id in list(backlogs):
+        channel = client.get_channel(channel_id)
+        if channel is not None:
+            start_backlog_flush(channel)
+    while work_pending() and loop.time() < deadline:
+        await asyncio.sleep(0.1)
+    if work_pending():
+        logger.warning(
+            f"Délai d'arrêt dépassé : {relay_queue.total} relais en file, "
+            f"{len(cleanup_tasks)} suppressions en attente"
+            + (", les relais inachevés seront rejoués depuis le journal" if relay_journal else "")
+        )
+    if preference_save_task is not None:
+        preference_save_task.cancel()
+        try:
+            write_preferences(preferences_snapshot())
+        except OSError as e:
+            logger.error(f"Impossible d'écrire {PREFERENCES_FILE} : {e}")
+    await flush_usage()
+    if webhook_session is not None:
+        await webhook_session.close()
+    await client.close()
+    if relay_journal:
+        await relay_journal.close()
+    translation_executor.shutdown(wait=False, cancel_futures=True)
+    logger.info("Arrêt terminé")
+
+mark_startup("init")
+logger.info(f"Module chargé en {startup_timings['init']} ms (imports : {startup_timings['imports']} ms)")
@@ -0,0 +1,141 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+# Journalisation commune au bot et à ses variantes :
+# - les enregistrements passent par une file et sont formatés puis écrits par un
+#   thread dédié (QueueListener) : la boucle d'événements n'écrit plus sur stderr ;
+# - les événements fréquents (extra={"event": ...}) sont échantillonnés selon
+#   LOG_SAMPLE_RATES, par exemple "message_received=0.01,mirror_sent=0" ;
+# - le contenu des messages passe par loggable() : tronqué (LOG_CONTENT=truncate,
+#   par défaut), masqué (redact) ou complet (full) ;
+# - LOG_FORMAT=json écrit une ligne JSON par enregistrement, avec les champs extra.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_CONTENT = os.getenv("LOG_CONTENT", "truncate")
+LOG_CONTENT_MAX = int(os.getenv("LOG_CONTENT_MAX", "80"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Taux par défaut des événements fréquents sans taux explicite
+LOG_SAMPLE_DEFAULT = float(os.getenv("LOG_SAMPLE_DEFAULT", "0.01"))
+
+# Attributs standard d'un LogRecord : tout le reste vient de `extra`
+STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+def parse_sample_rates(value):
+    rates = {}
+    for item in value.split(","):
+        if "=" in item:
+            event, rate = item.split("=", 1)
+            rates[event.strip()] = float(rate)
+    return rates
+
+LOG_SAMPLE_RATES = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+
+# Texte de message utilisateur tel qu'il peut apparaître dans les logs
+def loggable(text):
+    if text is None:
+        return None
+    if LOG_CONTENT == "full":
+        return text
+    if LOG_CONTENT == "redact":
+        return f"<{len(text)} caractères>"
+    if len(text) > LOG_CONTENT_MAX:
+        return f"{text[:LOG_CONTENT_MAX]}… (+{len(text) - LOG_CONTENT_MAX})"
+    return text
+
+class SamplingFilter(logging.Filter):
+    def __init__(self):
+        super().__init__()
+        self.dropped = 0
+
+    def filter(self, record):
+        event = getattr(record, "event", None)
+        # Les avertissements et erreurs ne sont jamais échantillonnés
+        if event is None or record.levelno >= logging.WARNING:
+            return True
+        rate = LOG_SAMPLE_RATES.get(event, LOG_SAMPLE_DEFAULT)
+        if rate >= 1:
+            return True
+        if rate > 0 and random.random() < rate:
+            record.sample_rate = rate
+            return True
+        self.dropped += 1
+        return False
+
+# Le formatage (arguments, traces d'exception) est laissé au thread d'écriture
+class DeferredQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Mieux vaut perdre des logs que bloquer la boucle d'événements
+            self.dropped += 1
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(levelname)s:%(name)s:%(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        extra = " ".join(f"{key}={value}" for key, value in vars(record).items() if key not in STANDARD_ATTRIBUTES)
+        return f"{line} [{extra}]" if extra else line
+
+log_listener = None
+sampling_filter = SamplingFilter()
+queue_handler = None
+
+# Remplace logging.basicConfig : à appeler une fois, au démarrage
+def setup_logging():
+    global log_listener, queue_handler
+    if log_listener is not None:
+        return
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    queue_handler = DeferredQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    queue_handler.addFilter(sampling_filter)
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.handlers[:] = [queue_handler]
+    log_listener = QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(stop_logging)
+
+# Vide la file avant l'arrêt du processus
+def stop_logging():
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+def logging_metrics():
+    return {
+        "sampled_out": sampling_filter.dropped,
+        "queue_dropped": queue_handler.dropped if queue_handler else 0,
+        "queued": queue_handler.queue.qsize() if queue_handler else 0,
+    }
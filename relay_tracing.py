@@ -0,0 +1,152 @@
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Traces locales, façon traçage distribué, pour savoir où passe le temps d'un relais
+# ou d'un clic sur un drapeau. Chaque trace a pour clé l'id du message Discord ;
+# ses spans (recherche des salons, file d'attente, traduction, attente de la limite
+# de débit, requête HTTP...) s'emboîtent via un ContextVar, que les tâches asyncio
+# héritent à leur création. Les spans terminés vont dans un tampon circulaire
+# (TRACE_BUFFER_SIZE spans, 0 pour désactiver) et, si TRACE_FILE est défini, dans
+# un fichier JSONL écrit par un thread dédié.
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "5000"))
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACING = TRACE_BUFFER_SIZE > 0 or bool(TRACE_FILE)
+
+current_span = ContextVar("current_span", default=None)
+span_ids = itertools.count(1)
+finished_spans = deque(maxlen=max(TRACE_BUFFER_SIZE, 1))
+export_queue = None
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "started", "duration", "attrs", "status")
+
+    def __init__(self, name, trace_id, parent_id, attrs):
+        self.trace_id = trace_id
+        self.span_id = next(span_ids)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.attrs = attrs
+        self.status = "ok"
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def end(self, status=None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self.started
+        if status:
+            self.status = status
+        export(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+def export(span):
+    if TRACE_BUFFER_SIZE > 0:
+        finished_spans.append(span)
+    if export_queue is not None:
+        export_queue.put_nowait(span.to_dict())
+
+def write_spans():
+    with open(TRACE_FILE, "a", encoding="utf-8") as f:
+        while True:
+            entry = export_queue.get()
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            if export_queue.empty():
+                f.flush()
+
+if TRACE_FILE:
+    export_queue = queue.SimpleQueue()
+    threading.Thread(target=write_spans, name="traces", daemon=True).start()
+
+# Ouvre un span. Sans trace_id, il rejoint la trace du span parent (explicite ou
+# courant) ; sans trace en cours, rien n'est enregistré et None est renvoyé.
+def start_span(name, trace_id=None, parent=None, **attrs):
+    if not TRACING:
+        return None
+    if parent is None:
+        parent = current_span.get()
+    if trace_id is None:
+        if parent is None:
+            return None
+        trace_id = parent.trace_id
+    return Span(name, str(trace_id), parent.span_id if parent is not None else None, attrs)
+
+@contextmanager
+def activate(span):
+    token = current_span.set(span)
+    try:
+        yield span
+    finally:
+        current_span.reset(token)
+
+@contextmanager
+def span(name, trace_id=None, parent=None, **attrs):
+    opened = start_span(name, trace_id, parent, **attrs)
+    if opened is None:
+        yield None
+        return
+    token = current_span.set(opened)
+    try:
+        yield opened
+    except BaseException as e:
+        opened.status = type(e).__name__
+        raise
+    finally:
+        current_span.reset(token)
+        opened.end()
+
+# Enregistre après coup une étape déjà terminée (par exemple une attente mesurée
+# ailleurs), qui se termine maintenant
+def record_span(name, duration, parent=None, **attrs):
+    recorded = start_span(name, None, parent, **attrs)
+    if recorded is None:
+        return None
+    recorded.start -= duration
+    recorded.duration = duration
+    export(recorded)
+    return recorded
+
+# Traces les plus récentes d'abord, regroupées par clé ; `min_ms` filtre sur la
+# durée du span racine le plus long
+def get_traces(trace_id=None, limit=20, min_ms=0.0):
+    by_trace = defaultdict(list)
+    for finished in list(finished_spans):
+        if trace_id is None or finished.trace_id == trace_id:
+            by_trace[finished.trace_id].append(finished)
+    traces = []
+    for key, spans in by_trace.items():
+        roots = [s for s in spans if s.parent_id is None]
+        duration = max((s.duration for s in roots), default=0.0) * 1000
+        if duration < min_ms:
+            continue
+        spans.sort(key=lambda s: s.start)
+        traces.append({
+            "trace_id": key,
+            "root": roots[0].name if roots else None,
+            "start": round(spans[0].start, 6),
+            "duration_ms": round(duration, 3),
+            "spans": [s.to_dict() for s in spans],
+        })
+    traces.sort(key=lambda trace: trace["start"], reverse=True)
+    return traces[:limit]
@@ -0,0 +1,35 @@
+import time
+from dotenv import load_dotenv
+from flask import Flask
+
+# Démarrage rapide : le serveur Flask (route de santé) démarre avant l'import de
+# discord et l'initialisation du bot (relay_bot.py), pour que le contrôle de santé de
+# la plateforme réponde pendant le démarrage. La durée de chaque étape, mesurée depuis
+# le début du chargement de ce module, est publiée dans /metrics (startup).
+module_started = time.perf_counter()
+startup_timings = {}
+
+def mark_startup(step):
+    startup_timings[step] = round((time.perf_counter() - module_started) * 1000)
+
+# Charger les variables d'environnement depuis le fichier .env
+load_dotenv()
+
+# Configurer les logs pour mieux diagnostiquer les problèmes (file d'écriture,
+# échantillonnage et troncature du contenu : voir relay_logging.py)
+import relay_logging
+relay_logging.setup_logging()
+
+# Configuration du serveur Flask ; relay_bot.py y ajoute /metrics, /traces et /usage
+app = Flask(__name__)
+
+@app.route('/')
+def home():
+    return "Bot is running!"
+
+@app.route('/ping')
+def ping():
+    return "OK", 200  # Route keep-alive
+
+def run_flask():
+    app.run(host='0.0.0.0', port=8080, debug=False)
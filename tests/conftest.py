@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+
+# relay_bot lit sa configuration à l'import : pas de journal, de fichiers d'état
+# partagés ni de rechargement de la configuration pendant les tests
+state_dir = tempfile.mkdtemp(prefix="relay_bot_tests_")
+os.environ.update({
+    "RELAY_JOURNAL": "",
+    "USAGE_FILE": "",
+    "TRACE_FILE": "",
+    "PREFERENCES_FILE": os.path.join(state_dir, "preferences.json"),
+    "GUILD_CONFIG_FILE": os.path.join(state_dir, "guilds.json"),
+    "CONFIG_RELOAD_INTERVAL": "0",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+import fakes
+import relay_bot
+
+# État global lié à une boucle d'événements : chaque test (un asyncio.run) repart à neuf
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(relay_bot, "scheduler", relay_bot.SendScheduler(relay_bot.SEND_WORKERS))
+    monkeypatch.setattr(relay_bot, "relay_queue", relay_bot.RelayQueue())
+    monkeypatch.setattr(relay_bot, "sequencer", relay_bot.DeliverySequencer())
+    monkeypatch.setattr(relay_bot, "translation_governor", relay_bot.TranslationGovernor())
+    monkeypatch.setattr(relay_bot, "translation_usage", relay_bot.TranslationUsage())
+    monkeypatch.setattr(relay_bot, "shutdown_event", asyncio.Event())
+    monkeypatch.setattr(relay_bot, "webhook_lock", asyncio.Lock())
+    monkeypatch.setattr(relay_bot, "mirror_map", OrderedDict())
+    monkeypatch.setattr(relay_bot, "translation_cache", OrderedDict())
+    monkeypatch.setattr(relay_bot, "translations_in_flight", {})
+    monkeypatch.setattr(relay_bot, "burst_groups", {})
+    monkeypatch.setattr(relay_bot, "backlogs", relay_bot.defaultdict(relay_bot.deque))
+    monkeypatch.setattr(relay_bot, "backlog_gates", {})
+    monkeypatch.setattr(relay_bot, "digest_timers", {})
+    monkeypatch.setattr(relay_bot, "blocking_translate", fakes.fake_translate)
+    monkeypatch.setattr(relay_bot.client, "get_channel", fakes.channels.get)
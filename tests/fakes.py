@@ -0,0 +1,86 @@
+import itertools
+from types import SimpleNamespace
+
+# Objets Discord minimaux : juste ce que relay_bot lit et appelle
+ids = itertools.count(1000)
+# id -> salon, pour client.get_channel
+channels = {}
+
+class FakeUser:
+    def __init__(self, name, bot=False):
+        self.id = next(ids)
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{self.id}>"
+        self.bot = bot
+        self.display_avatar = SimpleNamespace(url=f"https://cdn.example/{name}.png")
+        self.dms = []
+
+    async def send(self, content):
+        self.dms.append(content)
+        return FakeMessage(None, self, content)
+
+class FakeMessage:
+    def __init__(self, channel, author, content, attachments=()):
+        self.id = next(ids)
+        self.channel = channel
+        self.guild = channel.guild if channel is not None else None
+        self.author = author
+        self.content = content
+        self.attachments = list(attachments)
+        self.webhook_id = None
+        self.jump_url = f"https://discord.example/{self.id}"
+        self.deleted = False
+
+    async def edit(self, content=None, **kwargs):
+        self.content = content
+        return self
+
+    async def delete(self):
+        self.deleted = True
+
+    async def add_reaction(self, emoji):
+        pass
+
+class FakeChannel:
+    def __init__(self, guild, name):
+        self.id = next(ids)
+        self.guild = guild
+        self.name = name
+        self.sent = []
+        channels[self.id] = self
+
+    async def send(self, content=None, **kwargs):
+        message = FakeMessage(self, None, content)
+        self.sent.append(message)
+        return message
+
+    async def fetch_message(self, message_id):
+        return next(message for message in self.sent if message.id == message_id)
+
+    def get_partial_message(self, message_id):
+        return next((message for message in self.sent if message.id == message_id), FakeMessage(self, None, None))
+
+    async def delete_messages(self, messages):
+        for target in messages:
+            self.get_partial_message(target.id).deleted = True
+
+    def contents(self):
+        return [message.content for message in self.sent]
+
+class FakeGuild:
+    def __init__(self, names, members=()):
+        self.id = next(ids)
+        self.name = f"serveur-{self.id}"
+        self.text_channels = [FakeChannel(self, name) for name in names]
+        self.members = {member.id: member for member in members}
+
+    def channel(self, name):
+        return next(channel for channel in self.text_channels if channel.name == name)
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+# Traducteur de test : préfixe le texte par la langue cible, ligne par ligne
+def fake_translate(text, src, dest):
+    return "\n".join(f"[{dest}] {line}" for line in text.split("\n"))
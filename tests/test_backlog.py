@@ -0,0 +1,129 @@
+import asyncio
+
+import relay_bot
+from fakes import FakeGuild, FakeMessage, FakeUser, fake_translate
+
+def backlog_items(channel, texts):
+    author = FakeUser("alice")
+    return [relay_bot.BacklogItem(FakeMessage(channel, author, text), "fr") for text in texts]
+
+def test_batch_chunks_respect_size_limit(monkeypatch):
+    monkeypatch.setattr(relay_bot, "TRANSLATION_BATCH_MAX_CHARS", 10)
+    assert relay_bot.batch_chunks(["abcd", "efgh", "ijkl", "x" * 30, "mn"]) == [["abcd", "efgh"], ["ijkl"], ["x" * 30], ["mn"]]
+
+def test_digest_is_translated_in_bounded_requests(monkeypatch):
+    monkeypatch.setattr(relay_bot, "TRANSLATION_BATCH_MAX_CHARS", 40)
+    requests = []
+
+    def recording_translate(text, src, dest):
+        requests.append(text)
+        return fake_translate(text, src, dest)
+
+    monkeypatch.setattr(relay_bot, "blocking_translate", recording_translate)
+
+    async def scenario():
+        guild = FakeGuild(["general-fr", "general-en"])
+        target = guild.channel("general-en")
+        texts = [f"message numéro {index} du rattrapage" for index in range(6)]
+        await relay_bot.post_consolidated(target, backlog_items(target, texts), "*Résumé :*")
+        assert len(requests) > 1 and all(len(text) <= 40 for text in requests)
+        assert target.contents()[0].split("\n")[1:] == [f"**alice**: [en] {text}" for text in texts]
+
+    asyncio.run(scenario())
+
+def test_digest_falls_back_to_original_text(monkeypatch):
+    def broken_translate(text, src, dest):
+        raise ValueError("réponse illisible")
+
+    monkeypatch.setattr(relay_bot, "blocking_translate", broken_translate)
+
+    async def scenario():
+        guild = FakeGuild(["general-fr", "general-en"])
+        target = guild.channel("general-en")
+        await relay_bot.post_consolidated(target, backlog_items(target, ["bonjour à tous"]), "*Résumé :*")
+        assert target.contents() == ["*Résumé :*\n**alice**: bonjour à tous"]
+
+    asyncio.run(scenario())
+
+def test_flush_waits_for_mirrors_reserved_before_it(monkeypatch):
+    async def scenario():
+        released = asyncio.Event()
+        acquire = relay_bot.translation_governor.acquire
+
+        async def slow_acquire(guild_id):
+            await released.wait()
+            await acquire(guild_id)
+
+        monkeypatch.setattr(relay_bot.translation_governor, "acquire", slow_acquire)
+        guild = FakeGuild(["general-fr", "general-en"])
+        target = guild.channel("general-en")
+        live = relay_bot.prepare_relay(FakeMessage(guild.channel("general-fr"), FakeUser("bob"), "salut"))
+        relay = asyncio.create_task(relay_bot.run_relay(live))
+        relay_bot.backlogs[target.id].extend(backlog_items(target, ["bonjour"]))
+        relay_bot.start_backlog_flush(target)
+        # Réservé après le rattrapage : publié après lui
+        later = relay_bot.prepare_relay(FakeMessage(guild.channel("general-fr"), FakeUser("bob"), "à plus"))
+        later_relay = asyncio.create_task(relay_bot.run_relay(later))
+        await asyncio.sleep(0.01)
+        assert target.contents() == []
+        released.set()
+        await asyncio.gather(relay, later_relay)
+        while relay_bot.backlog_gates:
+            await asyncio.sleep(0.01)
+        assert target.contents() == [
+            "**bob**: [en] salut",
+            "*1 message(s) pendant votre absence :*\n**alice**: [en] bonjour",
+            "**bob**: [en] à plus",
+        ]
+
+    asyncio.run(scenario())
+
+def test_digest_for_removed_channel_is_dropped():
+    async def scenario():
+        guild = FakeGuild(["general-fr", "general-en", "general-xx"])
+        target = guild.channel("general-xx")
+        dropped = relay_bot.demand_stats["backlog_dropped"]
+        await relay_bot.post_consolidated(target, backlog_items(target, ["bonjour"]), "*Résumé :*")
+        assert target.contents() == []
+        assert relay_bot.demand_stats["backlog_dropped"] == dropped + 1
+
+    asyncio.run(scenario())
+
+def deferred_texts(channel):
+    return [item.content for item in relay_bot.backlogs[channel.id]]
+
+def test_burst_fragments_reach_deferred_targets(monkeypatch):
+    monkeypatch.setattr(relay_bot, "COALESCE_WINDOW", 5)
+    monkeypatch.setattr(relay_bot, "COALESCE_EDIT_DELAY", 0)
+    monkeypatch.setattr(relay_bot, "DIGEST_CHANNELS", {"general-kr": 600})
+
+    async def scenario():
+        guild = FakeGuild(["general-fr", "general-en", "general-kr"])
+        source = guild.channel("general-fr")
+        alice = FakeUser("alice")
+        await relay_bot.on_message(FakeMessage(source, alice, "bonjour"))
+        await relay_bot.on_message(FakeMessage(source, alice, "ça va ?"))
+        while not relay_bot.relay_queue.idle() or not guild.channel("general-en").sent:
+            await asyncio.sleep(0.01)
+        # La copie en direct est complétée par la rafale, le résumé reçoit aussi le second message
+        assert deferred_texts(guild.channel("general-kr")) == ["bonjour", "ça va ?"]
+
+    asyncio.run(scenario())
+
+def test_merged_messages_reach_deferred_targets(monkeypatch):
+    monkeypatch.setattr(relay_bot, "RELAY_QUEUE_GUILD_MAX", 1)
+    monkeypatch.setattr(relay_bot, "RELAY_SHED_POLICY", "merge")
+    monkeypatch.setattr(relay_bot, "DIGEST_CHANNELS", {"general-kr": 600})
+
+    async def scenario():
+        queue = relay_bot.RelayQueue()
+        queue.has_work = asyncio.Event()
+        queue.workers = [None]
+        guild = FakeGuild(["general-fr", "general-en", "general-kr"])
+        source = guild.channel("general-fr")
+        alice = FakeUser("alice")
+        job = queue.submit(FakeMessage(source, alice, "bonjour"))
+        assert queue.submit(FakeMessage(source, alice, "ça va ?")) is job
+        assert deferred_texts(guild.channel("general-kr")) == ["bonjour", "ça va ?"]
+
+    asyncio.run(scenario())
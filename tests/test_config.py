@@ -0,0 +1,70 @@
+import json
+import os
+
+import pytest
+
+import relay_bot
+from fakes import FakeChannel, FakeGuild
+
+def test_duplicate_channel_does_not_recompile_routes(monkeypatch):
+    config = relay_bot.GuildConfig({"general-fr": "fr", "general-en": "en"}, {"🇫🇷": "fr"})
+    guild = FakeGuild(["general-fr", "general-en"])
+    duplicate = FakeChannel(guild, "general-fr")
+    guild.text_channels.append(duplicate)
+    compiled = []
+    compile_routes = relay_bot.GuildConfig.compile_routes
+    monkeypatch.setattr(relay_bot.GuildConfig, "compile_routes", lambda self, guild: compiled.append(guild) or compile_routes(self, guild))
+    first = guild.channel("general-fr")
+    assert config.route(first) == ("fr", ((guild.channel("general-en"), "en"),))
+    # Le doublon garde sa langue mais n'est relayé nulle part, sans recompiler la table
+    for _ in range(3):
+        assert config.route(duplicate) == ("fr", ())
+    assert len(compiled) == 1
+    config.routes.pop(guild.id)
+    config.route(first)
+    assert len(compiled) == 2
+
+def test_guild_sections_inherit_the_default(monkeypatch, tmp_path):
+    path = tmp_path / "guilds.json"
+    path.write_text(json.dumps({
+        "default": {"event_channel": "evenements"},
+        "123": {"channels": {"salon-fr": "fr", "salon-en": "en"}},
+    }), encoding="utf-8")
+    monkeypatch.setattr(relay_bot, "GUILD_CONFIG_FILE", str(path))
+    default, configs = relay_bot.load_guild_configs()
+    assert default.event_channel == "evenements" and default.channels == relay_bot.builtin_config.channels
+    assert configs[123].channels == {"salon-fr": "fr", "salon-en": "en"}
+    assert configs[123].event_channel == "evenements" and configs[123].lang_map == relay_bot.builtin_config.lang_map
+
+def test_missing_file_uses_builtin_config(monkeypatch, tmp_path):
+    monkeypatch.setattr(relay_bot, "GUILD_CONFIG_FILE", str(tmp_path / "absent.json"))
+    assert relay_bot.load_guild_configs() == (relay_bot.builtin_config, {})
+
+@pytest.mark.parametrize("data, error", [
+    ([], "le fichier doit contenir un objet"),
+    ({"serveur": {}}, "id de serveur invalide"),
+    ({"1": {"channels": {}}}, "channels doit être un objet non vide"),
+    ({"1": {"flags": {"🇫🇷": "français"}}}, "code de langue invalide"),
+    ({"1": {"event_channel": ""}}, "event_channel doit être un nom de salon"),
+    ({"1": {"channels": {"general-fr": "fr"}, "event_channel": "general-fr"}}, "à la fois relais et événements"),
+])
+def test_invalid_files_are_rejected(monkeypatch, tmp_path, data, error):
+    path = tmp_path / "guilds.json"
+    path.write_text(json.dumps(data), encoding="utf-8")
+    monkeypatch.setattr(relay_bot, "GUILD_CONFIG_FILE", str(path))
+    with pytest.raises(ValueError, match=error):
+        relay_bot.load_guild_configs()
+
+def test_invalid_reload_keeps_previous_config(monkeypatch, tmp_path):
+    path = tmp_path / "guilds.json"
+    path.write_text(json.dumps({"5": {"channels": {"salon-fr": "fr", "salon-en": "en"}}}), encoding="utf-8")
+    monkeypatch.setattr(relay_bot, "GUILD_CONFIG_FILE", str(path))
+    monkeypatch.setattr(relay_bot, "config_mtime", None)
+    monkeypatch.setattr(relay_bot, "default_config", relay_bot.default_config)
+    monkeypatch.setattr(relay_bot, "guild_configs", {})
+    assert relay_bot.reload_guild_configs()
+    loaded = relay_bot.guild_configs[5]
+    path.write_text('{"5": {"channels": ', encoding="utf-8")
+    os.utime(path, ns=(0, 1))
+    assert not relay_bot.reload_guild_configs()
+    assert relay_bot.guild_configs[5] is loaded
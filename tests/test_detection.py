@@ -0,0 +1,25 @@
+import pytest
+
+import relay_bot
+
+@pytest.mark.parametrize("text, lang", [
+    ("bonjour à tous, on se retrouve ce soir pour le raid ?", "fr"),
+    ("hello everyone, does anyone know when the event starts?", "en"),
+    ("hola a todos, ¿alguien sabe a qué hora empieza el evento?", "es"),
+    ("guten Abend zusammen, wer kommt heute noch mit zum Raid?", "de"),
+    ("всем привет, кто сегодня идёт в рейд?", "ru"),
+    ("안녕하세요 여러분", "ko"),
+    ("こんにちは、元気ですか", "ja"),
+    ("大家好，今晚一起玩吗", "zh-cn"),
+])
+def test_detects_language(text, lang):
+    assert relay_bot.detect_language(text) == lang
+
+@pytest.mark.parametrize("text", ["", "ok", "lol !!", "12:30", "🇫🇷 🇬🇧"])
+def test_too_little_text_is_undecided(text):
+    assert relay_bot.detect_language(text) is None
+
+def test_links_mentions_and_emojis_are_ignored():
+    # Sans le bruit, il ne reste que deux lettres : pas assez pour trancher
+    assert relay_bot.detect_language("<@123456789> https://example.com/bonjour-tout-le-monde :smile: ok") is None
+    assert relay_bot.detect_language("<@123456789> bonjour tout le monde, ça va ?") == "fr"
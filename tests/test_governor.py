@@ -0,0 +1,89 @@
+import asyncio
+from types import SimpleNamespace
+
+import relay_bot
+from fakes import FakeGuild, FakeMessage, FakeUser
+
+def test_cancelled_wait_refunds_its_token(monkeypatch):
+    monkeypatch.setattr(relay_bot, "TRANSLATION_GLOBAL_LIMIT", (1, 10.0))
+    monkeypatch.setattr(relay_bot, "TRANSLATION_GUILD_LIMIT", None)
+    monkeypatch.setattr(relay_bot, "TRANSLATION_MAX_WAIT", 60)
+
+    async def scenario():
+        governor = relay_bot.translation_governor
+        await governor.acquire(None)
+        waiting = asyncio.create_task(governor.acquire(None))
+        await asyncio.sleep(0)
+        assert governor.waiting == 1 and governor.global_bucket.tokens < 0
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert governor.waiting == 0 and governor.global_bucket.tokens >= 0
+
+    asyncio.run(scenario())
+
+def test_throttled_edit_shows_untranslated_text(monkeypatch):
+    async def scenario():
+        guild = FakeGuild(["general-fr", "general-en"])
+        message = FakeMessage(guild.channel("general-fr"), FakeUser("alice"), "bonjour")
+        await relay_bot.run_relay(relay_bot.prepare_relay(message))
+
+        quota = {"exhausted": True}
+        acquire = relay_bot.translation_governor.acquire
+
+        async def throttled(guild_id):
+            if quota["exhausted"]:
+                raise relay_bot.TranslationThrottled("quota de traduction épuisé")
+            await acquire(guild_id)
+
+        monkeypatch.setattr(relay_bot.translation_governor, "acquire", throttled)
+        message.content = "bonsoir"
+        payload = SimpleNamespace(message_id=message.id, channel_id=message.channel.id, data={"content": "bonsoir"}, cached_message=message)
+        await relay_bot.on_raw_message_edit(payload)
+        target = guild.channel("general-en")
+        assert target.contents() == ["**alice**: bonsoir"]
+        assert relay_bot.mirror_map[message.id].mirrors[target.id][2] is None
+        # Quota rétabli : la modification suivante retraduit tout le texte
+        quota["exhausted"] = False
+        message.content = "bonne nuit"
+        payload.data["content"] = "bonne nuit"
+        await relay_bot.on_raw_message_edit(payload)
+        assert target.contents() == ["**alice**: [en] bonne nuit"]
+
+    asyncio.run(scenario())
+
+def test_guild_bucket_throttles_only_its_guild(monkeypatch):
+    monkeypatch.setattr(relay_bot, "TRANSLATION_GLOBAL_LIMIT", (10, 1.0))
+    monkeypatch.setattr(relay_bot, "TRANSLATION_GUILD_LIMIT", (2, 60.0))
+    monkeypatch.setattr(relay_bot, "TRANSLATION_MAX_WAIT", 1)
+
+    async def scenario():
+        governor = relay_bot.translation_governor
+        await governor.acquire(1)
+        await governor.acquire(1)
+        # Prochain jeton du serveur 1 dans 30 s, au-delà de TRANSLATION_MAX_WAIT
+        try:
+            await governor.acquire(1)
+        except relay_bot.TranslationThrottled:
+            pass
+        else:
+            raise AssertionError("le serveur 1 a épuisé son quota")
+        await governor.acquire(2)
+        assert governor.stats == {"granted": 3, "throttled": 1}
+        # Un refus ne consomme aucun jeton
+        assert governor.global_bucket.tokens > 6
+
+    asyncio.run(scenario())
+
+def test_short_wait_is_queued(monkeypatch):
+    monkeypatch.setattr(relay_bot, "TRANSLATION_GLOBAL_LIMIT", (1, 0.05))
+    monkeypatch.setattr(relay_bot, "TRANSLATION_GUILD_LIMIT", None)
+
+    async def scenario():
+        governor = relay_bot.translation_governor
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await asyncio.gather(*(governor.acquire(None) for _ in range(3)))
+        assert loop.time() - started >= 0.09
+        assert governor.stats == {"granted": 3, "queued": 2}
+
+    asyncio.run(scenario())
@@ -0,0 +1,61 @@
+import asyncio
+
+import relay_bot
+import fakes
+from fakes import FakeGuild, FakeMessage, FakeUser
+
+async def wait_until_idle():
+    await asyncio.sleep(0.01)
+    while not relay_bot.relay_queue.idle() or not relay_bot.scheduler.idle():
+        await asyncio.sleep(0.01)
+
+# Relais enregistré dans un premier journal, dont seul general-en a été acquitté
+async def interrupted_relay(monkeypatch, path, guild):
+    journal = relay_bot.RelayJournal(str(path))
+    monkeypatch.setattr(relay_bot, "relay_journal", journal)
+    message = FakeMessage(guild.channel("general-fr"), FakeUser("alice"), "bonjour tout le monde")
+    job = relay_bot.prepare_relay(message)
+    await job.persisted
+    journal.ack(message.id, [guild.channel("general-en").id])
+    await journal.close()
+    # Le processus s'arrête là : ses places dans l'ordre de livraison disparaissent avec lui
+    monkeypatch.setattr(relay_bot, "sequencer", relay_bot.DeliverySequencer())
+    return message
+
+def test_replay_sends_only_unacknowledged_targets(monkeypatch, tmp_path):
+    async def scenario():
+        guild = FakeGuild(["general-fr", "general-en", "general-de"])
+        await interrupted_relay(monkeypatch, tmp_path / "journal.db", guild)
+        monkeypatch.setattr(relay_bot, "relay_journal", relay_bot.RelayJournal(str(tmp_path / "journal.db")))
+        await relay_bot.replay_journal()
+        await wait_until_idle()
+        assert guild.channel("general-en").contents() == []
+        assert guild.channel("general-de").contents() == ["**alice**: [de] bonjour tout le monde"]
+        assert relay_bot.relay_journal.stats["replayed"] == 1
+        assert not relay_bot.relay_journal.pending
+        await relay_bot.relay_journal.close()
+
+    asyncio.run(scenario())
+
+def test_replay_keeps_jobs_for_unknown_channels(monkeypatch, tmp_path):
+    async def scenario():
+        guild = FakeGuild(["general-fr", "general-en", "general-de"])
+        message = await interrupted_relay(monkeypatch, tmp_path / "journal.db", guild)
+        # Salon d'un autre shard (ou pas encore visible) : rien n'est acquitté
+        monkeypatch.delitem(fakes.channels, message.channel.id)
+        journal = relay_bot.RelayJournal(str(tmp_path / "journal.db"))
+        monkeypatch.setattr(relay_bot, "relay_journal", journal)
+        await relay_bot.replay_journal()
+        assert journal.stats["skipped"] == 1 and not journal.pending
+        pending = await journal.load_pending()
+        assert [(job_id, remaining) for job_id, _, _, remaining in pending] == [(message.id, [guild.channel("general-de").id])]
+        await journal.close()
+
+    asyncio.run(scenario())
+
+def test_shard_path(monkeypatch):
+    monkeypatch.setattr(relay_bot, "SHARD_IDS", None)
+    assert relay_bot.shard_path("relay_journal.db") == "relay_journal.db"
+    monkeypatch.setattr(relay_bot, "SHARD_IDS", [0, 1])
+    assert relay_bot.shard_path("relay_journal.db") == "relay_journal.shards-0-1.db"
+    assert relay_bot.shard_path("") == ""
@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+
+import discord
+
+import relay_bot
+from fakes import FakeGuild, FakeMessage, FakeUser
+
+async def relayed(guild, text):
+    message = FakeMessage(guild.channel("general-fr"), FakeUser("alice"), text)
+    await relay_bot.run_relay(relay_bot.prepare_relay(message))
+    return message
+
+def test_edit_of_uncached_message_is_propagated(monkeypatch):
+    author = {"id": "42", "username": "alice", "discriminator": "0001", "avatar": None}
+    monkeypatch.setattr(relay_bot.client._connection, "store_user", lambda data: FakeUser(data["username"]))
+
+    async def scenario():
+        guild = FakeGuild(["general-fr", "general-en"])
+        message = await relayed(guild, "bonjour")
+        # Message sorti du cache de discord.py : seul l'événement brut arrive
+        payload = SimpleNamespace(
+            message_id=message.id, channel_id=message.channel.id, cached_message=None,
+            data={"content": "bonsoir", "author": author, "attachments": []},
+        )
+        await relay_bot.on_raw_message_edit(payload)
+        assert guild.channel("general-en").contents() == ["**alice**: [en] bonsoir"]
+
+    asyncio.run(scenario())
+
+def test_old_mirrors_are_deleted_one_by_one(monkeypatch):
+    bulk = []
+
+    async def delete_messages(self, targets):
+        bulk.append(len(targets))
+
+    monkeypatch.setattr("fakes.FakeChannel.delete_messages", delete_messages)
+
+    async def scenario():
+        guild = FakeGuild(["general-fr", "general-en"])
+        old = await relayed(guild, "bonjour")
+        recent = await relayed(guild, "bonsoir")
+        # Les identifiants des faux messages datent de 2015 : on rajeunit la seconde copie
+        mirror_id, lang, translated, via_webhook = relay_bot.mirror_map[recent.id].mirrors[guild.channel("general-en").id]
+        fresh_id = discord.utils.time_snowflake(discord.utils.utcnow())
+        relay_bot.mirror_map[recent.id].mirrors[guild.channel("general-en").id] = (fresh_id, lang, translated, via_webhook)
+        await relay_bot.delete_mirrors([old.id, recent.id])
+        old_mirror, recent_mirror = guild.channel("general-en").sent
+        assert old_mirror.deleted and not recent_mirror.deleted
+        assert bulk == [1]
+
+    asyncio.run(scenario())
+
+def test_optimistic_mirror_has_no_translation_until_it_arrives(monkeypatch):
+    monkeypatch.setattr(relay_bot, "RELAY_OPTIMISTIC", True)
+
+    async def scenario():
+        released = asyncio.Event()
+        acquire = relay_bot.translation_governor.acquire
+
+        async def slow_acquire(guild_id):
+            await released.wait()
+            await acquire(guild_id)
+
+        monkeypatch.setattr(relay_bot.translation_governor, "acquire", slow_acquire)
+        guild = FakeGuild(["general-fr", "general-en"])
+        target = guild.channel("general-en")
+        message = FakeMessage(guild.channel("general-fr"), FakeUser("alice"), "bonjour")
+        job = relay_bot.prepare_relay(message)
+        relay = asyncio.create_task(relay_bot.run_relay(job))
+        while target.id not in job.entry.mirrors:
+            await asyncio.sleep(0)
+        # La copie montre le texte original, qui n'est pas une traduction
+        assert target.contents() == ["**alice**: bonjour"]
+        assert job.entry.mirrors[target.id][2] is None
+        released.set()
+        await relay
+        assert target.contents() == ["**alice**: [en] bonjour"]
+        assert job.entry.mirrors[target.id][2] == ["[en] bonjour"]
+
+    asyncio.run(scenario())
+
+def test_source_deleted_before_relay_leaves_no_mirror():
+    async def scenario():
+        guild = FakeGuild(["general-fr", "general-en"])
+        message = FakeMessage(guild.channel("general-fr"), FakeUser("bob"), "spam")
+        job = relay_bot.prepare_relay(message)
+        # Supprimé par un modérateur pendant que le relais attend dans la file
+        await relay_bot.on_raw_message_delete(SimpleNamespace(message_id=message.id))
+        await relay_bot.run_relay(job)
+        assert guild.channel("general-en").sent == []
+
+    asyncio.run(scenario())
+
+def test_source_deleted_during_send_removes_the_mirror(monkeypatch):
+    async def scenario():
+        guild = FakeGuild(["general-fr", "general-en"])
+        target = guild.channel("general-en")
+        message = FakeMessage(guild.channel("general-fr"), FakeUser("bob"), "spam")
+        send = target.send
+
+        async def slow_send(content=None, **kwargs):
+            await relay_bot.on_raw_message_delete(SimpleNamespace(message_id=message.id))
+            return await send(content, **kwargs)
+
+        monkeypatch.setattr(target, "send", slow_send)
+        await relay_bot.run_relay(relay_bot.prepare_relay(message))
+        assert [mirror.deleted for mirror in target.sent] == [True]
+
+    asyncio.run(scenario())
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+import relay_bot
+from fakes import FakeGuild, FakeMessage, FakeUser
+
+@pytest.fixture(autouse=True)
+def preferences(monkeypatch, tmp_path):
+    monkeypatch.setattr(relay_bot, "PREFERENCES_FILE", str(tmp_path / "preferences.json"))
+    monkeypatch.setattr(relay_bot, "user_preferences", {})
+    monkeypatch.setattr(relay_bot, "click_streaks", {})
+    monkeypatch.setattr(relay_bot, "preference_users", {})
+    monkeypatch.setattr(relay_bot, "preference_save_task", None)
+    monkeypatch.setattr(relay_bot.client, "get_user", lambda user_id: None)
+
+def test_clicks_enrol_user_in_one_guild_only():
+    async def scenario():
+        home, elsewhere = FakeGuild(["event-test"]), FakeGuild(["event-test"])
+        bob = FakeUser("bob")
+        for _ in range(relay_bot.PREFERENCE_CLICKS):
+            relay_bot.record_click(home, bob, "en")
+        await asyncio.sleep(0.01)
+        assert relay_bot.user_preferences == {home.id: {bob.id: "en"}}
+        # Inscription annoncée en privé
+        assert len(bob.dms) == 1 and "!langue off" in bob.dms[0]
+
+        alice = FakeUser("alice")
+        await relay_bot.deliver_to_preferences(FakeMessage(elsewhere.channel("event-test"), alice, "bonjour à tous, le raid commence ce soir"))
+        assert len(bob.dms) == 1
+        await relay_bot.deliver_to_preferences(FakeMessage(home.channel("event-test"), alice, "bonjour à tous, le raid commence ce soir"))
+        assert bob.dms[1].endswith("[en] bonjour à tous, le raid commence ce soir")
+
+    asyncio.run(scenario())
+
+def test_preferences_round_trip_per_guild():
+    async def scenario():
+        guild = FakeGuild(["event-test"])
+        bob = FakeUser("bob")
+        relay_bot.set_preference(guild.id, bob, "de")
+        relay_bot.write_preferences(relay_bot.preferences_snapshot())
+        assert relay_bot.load_preferences() == {guild.id: {bob.id: "de"}}
+        relay_bot.set_preference(guild.id, bob, None)
+        assert relay_bot.user_preferences == {}
+        assert bob.id not in relay_bot.preference_users
+
+    asyncio.run(scenario())
@@ -0,0 +1,28 @@
+import asyncio
+from types import SimpleNamespace
+
+import relay_bot
+from fakes import FakeGuild, FakeMessage, FakeUser
+
+def test_failed_reply_notifies_every_grouped_click(monkeypatch):
+    async def scenario():
+        released = asyncio.Event()
+
+        async def failing_acquire(guild_id):
+            await released.wait()
+            raise ConnectionError("traducteur injoignable")
+
+        monkeypatch.setattr(relay_bot.translation_governor, "acquire", failing_acquire)
+        channel = FakeGuild(["event-test"]).channel("event-test")
+        reaction = SimpleNamespace(message=FakeMessage(channel, FakeUser("alice"), "bonjour tout le monde"), emoji="🇬🇧")
+        monkeypatch.setattr(channel, "fetch_message", lambda message_id: asyncio.sleep(0, reaction.message))
+        bob, carol = FakeUser("bob"), FakeUser("carol")
+        first = asyncio.create_task(relay_bot.on_reaction_add(reaction, bob))
+        await asyncio.sleep(0.01)
+        # Second clic pendant la traduction : regroupé dans la même réponse
+        await relay_bot.on_reaction_add(reaction, carol)
+        released.set()
+        await first
+        assert channel.contents() == [f"{bob.mention} {carol.mention}, erreur lors de la traduction."]
+
+    asyncio.run(scenario())
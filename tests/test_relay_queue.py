@@ -0,0 +1,106 @@
+import asyncio
+from types import SimpleNamespace
+
+import relay_bot
+from fakes import FakeGuild, FakeMessage, FakeUser
+
+def idle_queue():
+    # File sans worker : les tests la vident eux-mêmes avec _next_job()
+    queue = relay_bot.RelayQueue()
+    queue.has_work = asyncio.Event()
+    queue.workers = [None]
+    return queue
+
+def test_shed_then_enqueue_then_dequeue(monkeypatch):
+    monkeypatch.setattr(relay_bot, "RELAY_QUEUE_GUILD_MAX", 1)
+    monkeypatch.setattr(relay_bot, "RELAY_SHED_POLICY", "drop_oldest")
+
+    async def scenario():
+        queue = idle_queue()
+        busy, other = FakeGuild(["general-fr", "general-en"]), FakeGuild(["general-fr", "general-en"])
+        author = FakeUser("alice")
+        queue.submit(FakeMessage(busy.channel("general-fr"), author, "bonjour"))
+        # File du serveur pleine : le premier message est abandonné au profit du second
+        kept = queue.submit(FakeMessage(busy.channel("general-fr"), author, "bonsoir"))
+        assert list(queue.rotation) == [busy.id]
+        later = queue.submit(FakeMessage(other.channel("general-fr"), author, "salut"))
+        assert queue.total == 2
+        assert queue._next_job() is kept
+        assert queue._next_job() is later
+        assert queue.total == 0
+        assert not queue.rotation and not queue.guilds
+        # Le serveur délesté repasse normalement par le tourniquet
+        again = queue.submit(FakeMessage(busy.channel("general-fr"), author, "re"))
+        assert queue._next_job() is again
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+
+def test_next_job_skips_emptied_guilds():
+    async def scenario():
+        queue = idle_queue()
+        guild = FakeGuild(["general-fr", "general-en"])
+        job = queue.submit(FakeMessage(guild.channel("general-fr"), FakeUser("bob"), "bonjour"))
+        queue.rotation.appendleft(guild.id + 1)
+        assert queue._next_job() is job
+        assert not queue.rotation
+
+    asyncio.run(scenario())
+
+def test_merge_keeps_authors_and_fragments_apart(monkeypatch):
+    monkeypatch.setattr(relay_bot, "RELAY_QUEUE_GUILD_MAX", 1)
+    monkeypatch.setattr(relay_bot, "RELAY_SHED_POLICY", "merge")
+
+    async def scenario():
+        queue = idle_queue()
+        guild = FakeGuild(["general-fr", "general-en"])
+        source, target = guild.channel("general-fr"), guild.channel("general-en")
+        alice, bob = FakeUser("alice"), FakeUser("bob")
+        first, second = FakeMessage(source, alice, "bonjour"), FakeMessage(source, alice, "ça va")
+        job = queue.submit(first)
+        assert queue.submit(second) is job
+        assert job.messages == [first, second]
+
+        # Modifié pendant l'attente : la copie part avec le nouveau texte
+        second.content = "tout va bien"
+        payload = SimpleNamespace(message_id=second.id, channel_id=source.id, data={"content": second.content}, cached_message=second)
+        await relay_bot.on_raw_message_edit(payload)
+        await relay_bot.run_relay(queue._next_job())
+        assert target.contents() == ["**alice**: [en] bonjour\n[en] tout va bien"]
+        # Supprimer un des messages fusionnés ne retire que son texte
+        await relay_bot.delete_mirrors([second.id])
+        await asyncio.sleep(0.01)
+        assert target.contents() == ["**alice**: [en] bonjour"]
+
+        # Un autre auteur n'est jamais fusionné : le plus ancien est abandonné à la place
+        kept = queue.submit(FakeMessage(source, alice, "encore moi"))
+        other = queue.submit(FakeMessage(source, bob, "salut"))
+        assert other is not kept and other.messages[0].author is bob
+        assert queue.stats["dropped"] == 1
+
+    asyncio.run(scenario())
+
+def test_untranslated_policy_uses_bounded_express_lane(monkeypatch):
+    monkeypatch.setattr(relay_bot, "RELAY_QUEUE_GUILD_MAX", 1)
+    monkeypatch.setattr(relay_bot, "RELAY_QUEUE_GLOBAL_MAX", 1)
+    monkeypatch.setattr(relay_bot, "RELAY_SHED_POLICY", "untranslated")
+
+    async def scenario():
+        queue = idle_queue()
+        guild = FakeGuild(["general-fr", "general-en"])
+        source, target = guild.channel("general-fr"), guild.channel("general-en")
+        author = FakeUser("alice")
+        oldest = queue.submit(FakeMessage(source, author, "bonjour"))
+        newer = queue.submit(FakeMessage(source, author, "bonsoir"))
+        # Le plus ancien passe en voie express, sans traduction ; la file reste bornée
+        assert list(queue.express) == [oldest] and not oldest.translate
+        assert queue.total == 1 and not queue.idle()
+        # Voie express pleine : le délestage suivant abandonne le plus ancien
+        latest = queue.submit(FakeMessage(source, author, "bonne nuit"))
+        assert queue.stats["dropped"] == 1
+        assert queue._next_job() is oldest
+        await relay_bot.run_relay(oldest)
+        assert target.contents() == ["**alice**: bonjour"]
+        assert queue._next_job() is latest and newer.done.done()
+
+    asyncio.run(scenario())
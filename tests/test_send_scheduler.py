@@ -0,0 +1,48 @@
+import asyncio
+
+import relay_bot
+
+def test_relay_lane_keeps_reserved_workers(monkeypatch):
+    monkeypatch.setattr(relay_bot, "SEND_RELAY_RESERVED", 1)
+
+    async def scenario():
+        scheduler = relay_bot.SendScheduler(2)
+        release = asyncio.Event()
+        started = []
+
+        async def slow_delete(index):
+            started.append(index)
+            await release.wait()
+            return index
+
+        cleanups = [
+            asyncio.ensure_future(scheduler.submit(relay_bot.PRIORITY_CLEANUP, ("delete", index), lambda index=index: slow_delete(index)))
+            for index in range(3)
+        ]
+        await asyncio.sleep(0.01)
+        # Une seule suppression occupe un worker, l'autre reste libre pour les copies
+        assert started == [0]
+        relayed = await asyncio.wait_for(scheduler.submit(relay_bot.PRIORITY_RELAY, ("send", 1), lambda: asyncio.sleep(0, "copie")), 1)
+        assert relayed == "copie"
+        release.set()
+        assert await asyncio.gather(*cleanups) == [0, 1, 2]
+        assert scheduler.idle()
+
+    asyncio.run(scenario())
+
+def test_failed_send_reaches_caller():
+    async def scenario():
+        scheduler = relay_bot.SendScheduler(1)
+
+        async def failing():
+            raise RuntimeError("refusé")
+
+        try:
+            await scheduler.submit(relay_bot.PRIORITY_RELAY, ("send", 1), failing)
+        except RuntimeError as e:
+            assert str(e) == "refusé"
+        else:
+            raise AssertionError("l'erreur de l'envoi doit remonter")
+        assert scheduler.metrics()["failed"] == {"relay": 1}
+
+    asyncio.run(scenario())
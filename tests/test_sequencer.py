@@ -0,0 +1,34 @@
+import asyncio
+
+import relay_bot
+
+def test_deliveries_follow_reservation_order():
+    async def scenario():
+        sequencer = relay_bot.DeliverySequencer()
+        delivered = []
+        slots = [sequencer.reserve(1, 2, seq) for seq in range(3)]
+        other = sequencer.reserve(1, 3, 0)
+
+        async def deliver(slot, delay):
+            await asyncio.sleep(delay)
+            async with slot:
+                delivered.append((slot.key[1], slot.seq))
+
+        # La dernière copie est prête la première, mais attend les précédentes du même salon cible
+        await asyncio.gather(deliver(slots[0], 0.03), deliver(slots[1], 0.02), deliver(slots[2], 0), deliver(other, 0.01))
+        assert delivered == [(3, 0), (2, 0), (2, 1), (2, 2)]
+        assert not sequencer.tails
+
+    asyncio.run(scenario())
+
+def test_abandoned_slot_releases_the_next_one():
+    async def scenario():
+        sequencer = relay_bot.DeliverySequencer()
+        first, second = sequencer.reserve(1, 2, 0), sequencer.reserve(1, 2, 1)
+        assert sequencer.pending(2) == [second.done]
+        await first.abandon()
+        async with second:
+            pass
+        assert second.done.done() and not sequencer.pending(2)
+
+    asyncio.run(scenario())
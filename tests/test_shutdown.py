@@ -0,0 +1,41 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import relay_bot
+import translation_worker
+
+class FakeJournal:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        await asyncio.sleep(0.01)
+        self.closed = True
+
+def test_supervise_waits_for_shutdown_to_finish(monkeypatch):
+    journal = FakeJournal()
+    executor = ThreadPoolExecutor(1)
+    monkeypatch.setattr(relay_bot, "relay_journal", journal)
+    monkeypatch.setattr(relay_bot, "translation_executor", executor)
+    monkeypatch.setattr(relay_bot, "shutdown_task", None)
+    monkeypatch.setattr(translation_worker, "warm_up", lambda: None)
+    gateway = {}
+
+    async def login(token):
+        gateway["closed"] = asyncio.Event()
+
+    # Le gateway rend la main dès sa fermeture, comme discord.py
+    async def connect(reconnect):
+        relay_bot.request_shutdown()
+        await gateway["closed"].wait()
+
+    async def close():
+        gateway["closed"].set()
+
+    monkeypatch.setattr(relay_bot.client, "login", login)
+    monkeypatch.setattr(relay_bot.client, "connect", connect)
+    monkeypatch.setattr(relay_bot.client, "close", close)
+    monkeypatch.setattr(relay_bot.client, "is_closed", lambda: "closed" in gateway and gateway["closed"].is_set())
+    asyncio.run(relay_bot.supervise("jeton"))
+    assert journal.closed
+    assert relay_bot.shutdown_task.done() and not relay_bot.shutdown_task.cancelled()
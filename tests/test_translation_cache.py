@@ -0,0 +1,74 @@
+import asyncio
+
+import relay_bot
+from fakes import fake_translate
+
+def recording(monkeypatch):
+    calls = []
+
+    def translate(text, src, dest):
+        calls.append((src, dest, text))
+        return fake_translate(text, src, dest)
+
+    monkeypatch.setattr(relay_bot, "blocking_translate", translate)
+    return calls
+
+def test_cache_serves_repeated_texts(monkeypatch):
+    calls = recording(monkeypatch)
+
+    async def scenario():
+        assert await relay_bot.translate_text("bonjour tout le monde", "en") == "[en] bonjour tout le monde"
+        assert await relay_bot.translate_text("bonjour tout le monde", "en") == "[en] bonjour tout le monde"
+        # Langue source détectée localement : le traducteur la reçoit, sans détection distante
+        assert calls == [("fr", "en", "bonjour tout le monde")]
+        assert await relay_bot.translate_text("bonjour tout le monde", "fr") == "bonjour tout le monde"
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
+
+def test_cache_evicts_least_recently_used(monkeypatch):
+    calls = recording(monkeypatch)
+    monkeypatch.setattr(relay_bot, "TRANSLATION_CACHE_SIZE", 2)
+
+    async def scenario():
+        for text in ("un", "deux", "un", "trois", "un", "deux"):
+            await relay_bot.translate_text(text, "en", src="fr")
+        # "deux" a été évincé par "trois", "un" est resté car relu entre-temps
+        assert [text for _, _, text in calls] == ["un", "deux", "trois", "deux"]
+
+    asyncio.run(scenario())
+
+def test_identical_requests_in_flight_are_shared(monkeypatch):
+    calls = recording(monkeypatch)
+
+    async def scenario():
+        results = await asyncio.gather(*(relay_bot.translate_text("bonsoir", "de", src="fr") for _ in range(5)))
+        assert results == ["[de] bonsoir"] * 5
+        assert len(calls) == 1
+        assert sum(counters["shared_requests"] for counters in relay_bot.translation_usage.window.values()) == 4
+        assert not relay_bot.translations_in_flight
+
+    asyncio.run(scenario())
+
+def test_failed_translation_is_not_cached(monkeypatch):
+    attempts = []
+
+    def flaky(text, src, dest):
+        attempts.append(text)
+        if len(attempts) == 1:
+            raise ConnectionError("traducteur injoignable")
+        return fake_translate(text, src, dest)
+
+    monkeypatch.setattr(relay_bot, "blocking_translate", flaky)
+
+    async def scenario():
+        try:
+            await relay_bot.translate_text("bonjour", "en", src="fr")
+        except ConnectionError:
+            pass
+        else:
+            raise AssertionError("l'erreur du traducteur doit remonter")
+        assert await relay_bot.translate_text("bonjour", "en", src="fr") == "[en] bonjour"
+        assert len(attempts) == 2
+
+    asyncio.run(scenario())
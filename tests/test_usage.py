@@ -0,0 +1,20 @@
+import relay_bot
+from fakes import FakeGuild, FakeUser
+
+def test_user_volume_is_keyed_by_id():
+    usage = relay_bot.TranslationUsage()
+    channel = FakeGuild(["general-fr"]).channel("general-fr")
+    alice, namesake = FakeUser("alice"), FakeUser("alice")
+    for user, text in ((alice, "bonjour"), (namesake, "salut"), (alice, "re")):
+        with relay_bot.usage_scope("relay", channel, user):
+            usage.record("upstream", text, "en")
+    # Renommée depuis : son volume reste sous le même id, affiché avec le nouveau nom
+    alice.name = "alice2"
+    with relay_bot.usage_scope("relay", channel, alice):
+        usage.record("cached", "ok", "en")
+    assert usage.metrics()["top_users"] == [
+        {"user_id": str(alice.id), "name": "alice2", "chars": 11},
+        {"user_id": str(namesake.id), "name": "alice", "chars": 5},
+    ]
+    assert [user["chars"] for user in usage.close_window()["users"]] == [11, 5]
+    assert usage.metrics()["top_users"] == []
@@ -0,0 +1,95 @@
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+import relay_bot
+from fakes import FakeGuild, FakeMessage, FakeUser
+
+webhook_ids = itertools.count(1)
+
+def not_found(code):
+    return discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), {"code": code, "message": "Unknown Webhook"})
+
+class FakeWebhook:
+    def __init__(self, deleted=False):
+        self.id = next(webhook_ids)
+        self.deleted = deleted
+        self.sent = []
+
+    async def send(self, content, **kwargs):
+        if self.deleted:
+            raise not_found(relay_bot.UNKNOWN_WEBHOOK)
+        self.sent.append(content)
+        return SimpleNamespace(id=len(self.sent))
+
+@pytest.fixture(autouse=True)
+def webhooks(monkeypatch):
+    monkeypatch.setattr(relay_bot, "RELAY_WEBHOOKS", True)
+    monkeypatch.setattr(relay_bot, "webhook_pool", {})
+    monkeypatch.setattr(relay_bot, "webhook_failures", {})
+    monkeypatch.setattr(relay_bot, "webhook_ids", set())
+    monkeypatch.setattr(relay_bot, "webhook_session", object())
+    created = []
+
+    # Chaque appel à l'API (liste puis création) rend un nouveau webhook
+    async def create_webhook(self, name):
+        created.append(FakeWebhook())
+        return SimpleNamespace(url=created[-1])
+
+    async def list_webhooks(self):
+        return []
+
+    monkeypatch.setattr("fakes.FakeChannel.webhooks", list_webhooks, raising=False)
+    monkeypatch.setattr("fakes.FakeChannel.create_webhook", create_webhook, raising=False)
+    monkeypatch.setattr(discord.Webhook, "from_url", lambda url, session: url)
+    return created
+
+def test_deleted_webhook_is_replaced_once(webhooks):
+    async def scenario():
+        channel = FakeGuild(["general-en"]).channel("general-en")
+        dead = FakeWebhook(deleted=True)
+        relay_bot.webhook_pool[channel.id] = dead
+        message = FakeMessage(channel, FakeUser("alice"), "hello")
+        assert await relay_bot.send_mirror(channel, message, "hello") == (1, True)
+        assert relay_bot.webhook_pool[channel.id] is webhooks[0]
+        assert webhooks[0].sent == ["hello"]
+
+    asyncio.run(scenario())
+
+def test_failed_lookup_expires(monkeypatch, webhooks):
+    async def scenario():
+        channel = FakeGuild(["general-en"]).channel("general-en")
+        permission = {"granted": False}
+
+        async def list_webhooks(self):
+            if not permission["granted"]:
+                raise discord.Forbidden(SimpleNamespace(status=403, reason="Forbidden"), "Missing Permissions")
+            return []
+
+        monkeypatch.setattr("fakes.FakeChannel.webhooks", list_webhooks, raising=False)
+        assert await relay_bot.get_webhook(channel) is None
+        # Permission accordée depuis : rien tant que le délai n'est pas écoulé, puis nouvel essai
+        permission["granted"] = True
+        assert await relay_bot.get_webhook(channel) is None
+        relay_bot.webhook_failures[channel.id] -= relay_bot.WEBHOOK_RETRY_AFTER
+        assert await relay_bot.get_webhook(channel) is webhooks[0]
+        assert channel.id not in relay_bot.webhook_failures
+
+    asyncio.run(scenario())
+
+def test_unavailable_webhook_falls_back_for_deletes_and_skips_edits(webhooks):
+    async def scenario():
+        channel = FakeGuild(["general-en"]).channel("general-en")
+        sent = await channel.send("**alice**: hello")
+        # Webhook oublié et nouvelle recherche en échec : get_webhook rend None
+        relay_bot.webhook_failures[channel.id] = relay_bot.time.monotonic()
+        message = FakeMessage(channel, FakeUser("alice"), "hello")
+        await relay_bot.edit_mirror(channel, sent.id, True, message, "bonjour")
+        assert sent.content == "**alice**: hello"
+        await relay_bot.delete_individually(channel, [(sent.id, True)])
+        assert sent.deleted and not webhooks
+
+    asyncio.run(scenario())
@@ -0,0 +1,25 @@
+import threading
+
+# Appels bloquants à googletrans, exécutés hors de la boucle d'événements du bot :
+# dans un thread (par défaut) ou dans un processus de traduction séparé
+# (TRANSLATION_PROCESSES dans relay_bot.py). Ce module reste volontairement léger pour
+# que les processus de traduction n'importent ni discord ni flask.
+
+# Un Translator par thread ou par processus (son client HTTP n'est pas partagé).
+# googletrans et sa pile HTTP ne sont importés qu'à la première utilisation, pour
+# ne pas ralentir le démarrage du bot.
+translator_local = threading.local()
+
+def get_translator():
+    translator = getattr(translator_local, "translator", None)
+    if translator is None:
+        from googletrans import Translator
+        translator = translator_local.translator = Translator()
+    return translator
+
+# Initialisation d'un processus de traduction : le client HTTP est prêt avant la première demande
+def warm_up():
+    get_translator()
+
+def translate(text, src, dest):
+    return get_translator().translate(text, src=src, dest=dest).text